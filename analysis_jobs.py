@@ -0,0 +1,101 @@
+import threading
+import traceback
+from collections import OrderedDict
+from game_analysis import game_positions
+from packed_analysis import PackedAnalysis
+
+# --- CONFIGURATION ---
+# Finished analyses are packed (a few KB per game), so thousands can stay attached for reruns and other sessions.
+MAX_FINISHED_JOBS = 2000
+
+
+class AnalysisJob:
+    """Analyzes one game on a background thread, publishing each ply as soon as it is ready.
+
+    `analysis` is a PackedAnalysis that only ever grows, so readers on other
+    threads can safely show the plies that are already there while the job is
+    still running.
+    """
+
+    def __init__(self, game):
+        self.game_info = dict(game.headers)
+        moves, self._boards = game_positions(game)
+        self.analysis = PackedAnalysis(self._boards[0].fen(), moves)
+        self.engine_calls = 0
+        self.error, self.done = None, False
+        self._thread = None
+
+    @property
+    def total_plies(self):
+        return self.analysis.total_plies
+
+    def start(self, results):
+        """Runs `results(boards)` (see game_analysis.position_results) on a daemon thread."""
+        self._thread = threading.Thread(target=self._run, args=(results,), daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self, results):
+        positions = None
+        try:
+            positions = results(self._boards)
+            for result, calls in positions:
+                self.analysis.add_position(result)
+                self.engine_calls += calls
+        except Exception as e:
+            self.error = f"{e}\n{traceback.format_exc()}"
+        finally:
+            # Closing the generator releases anything it holds (e.g. a pooled engine) now, not at garbage collection.
+            if hasattr(positions, "close"): positions.close()
+            # The boards are only needed to feed the engine; the packed analysis replays positions on demand.
+            self._boards, self.done = None, True
+
+
+class ArchiveAnalysisJob:
+    """Runs a batch archive analysis (see batch_analysis.analyze_archive) on a daemon thread, exposing its progress."""
+
+    def __init__(self, username):
+        self.username = username
+        self.completed, self.total = 0, None
+        self.analysed, self.error, self.done = 0, None, False
+
+    def start(self, run):
+        """Calls `run(on_progress)` on a daemon thread; it should return the number of games analysed."""
+        threading.Thread(target=self._run, args=(run,), daemon=True).start()
+        return self
+
+    def _progress(self, completed, total):
+        self.completed, self.total = completed, total
+
+    def _run(self, run):
+        try:
+            self.analysed = run(self._progress)
+        except Exception as e:
+            self.error = f"{e}\n{traceback.format_exc()}"
+        finally:
+            self.done = True
+
+
+class JobRegistry:
+    """Process-wide registry so reruns and other sessions reattach to a game that is already being analyzed."""
+
+    def __init__(self, max_finished=MAX_FINISHED_JOBS):
+        self.max_finished = max_finished
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_start(self, key, game, results):
+        """Returns the job for `key`, starting it with `results` if it is new or previously failed."""
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None or job.error:
+                job = AnalysisJob(game).start(results)
+                self._jobs[key] = job
+            self._jobs.move_to_end(key)
+            self._prune()
+            return job
+
+    def _prune(self):
+        finished = [key for key, job in self._jobs.items() if job.done]
+        for key in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[key]
@@ -0,0 +1,50 @@
+import asyncio
+import threading
+import httpx
+
+# HTTP/2 needs the optional `h2` package (installed by `httpx[http2]`); without it the client falls back to HTTP/1.1.
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# --- CONFIGURATION ---
+DEFAULT_TIMEOUT_SECONDS = 15.0
+MAX_CONNECTIONS = 20
+
+class AsyncBridge:
+    """A long-lived event loop on a background thread, with one persistent HTTP client, callable from sync code.
+
+    Streamlit reruns (and the updater daemon's polls) submit coroutines with
+    `run()` instead of `asyncio.run()`, so the loop, the connection pool and its
+    TLS/HTTP/2 sessions survive between calls. Coroutines get the shared client
+    as `bridge.client`; it must only be used from coroutines running on this loop.
+    """
+
+    def __init__(self, **client_kwargs):
+        client_kwargs.setdefault("http2", HTTP2_AVAILABLE)
+        client_kwargs.setdefault("timeout", DEFAULT_TIMEOUT_SECONDS)
+        client_kwargs.setdefault("limits", httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS))
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="async-bridge", daemon=True)
+        self._thread.start()
+        self.client = self.run(self._create_client(client_kwargs))
+
+    @staticmethod
+    async def _create_client(client_kwargs):
+        # Created on the loop so the pool's locks and connections belong to it.
+        return httpx.AsyncClient(**client_kwargs)
+
+    def run(self, coro, timeout=None):
+        """Runs a coroutine on the background loop and blocks until it finishes, returning its result or raising its exception."""
+        if threading.current_thread() is self._thread: raise RuntimeError("AsyncBridge.run() cannot be called from its own loop.")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def close(self):
+        """Closes the client and stops the loop thread."""
+        if not self.loop.is_running(): return
+        self.run(self.client.aclose())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
@@ -0,0 +1,120 @@
+import io
+import os
+import sys
+import math
+import time
+import shutil
+from collections import Counter
+import chess.pgn
+from db import reader, transaction
+from game_store import DB_NAME
+from eval_cache import EVAL_CACHE_DB
+from game_analysis import game_positions, position_results_parallel, ANALYSIS_WORKERS, ANALYSIS_DEPTH, ANALYSIS_NODES
+from packed_analysis import PackedAnalysis, MATE_THRESHOLD
+
+# --- CONFIGURATION ---
+# Games whose positions are queued on the engine pool together, so workers stay busy across game boundaries.
+BATCH_GAMES = int(os.environ.get("BATCH_ANALYSIS_GAMES", 8))
+# Centipawn score given to a forced mate when turning evaluations into win chances.
+MATE_CP = 1000
+QUALITY_COLUMNS = {"Excellent": "excellent", "Good": "good", "Inaccuracy": "inaccuracies", "Mistake": "mistakes", "Blunder": "blunders"}
+
+# --- ACCURACY ---
+def white_cp(score):
+    """A packed score as White-relative centipawns, with mates mapped to ±MATE_CP."""
+    return score if abs(score) < MATE_THRESHOLD else math.copysign(MATE_CP, score)
+
+def win_percent(cp):
+    """White's winning chances (0-100) for a centipawn score, using Lichess's logistic model."""
+    return 50 + 50 * (2 / (1 + math.exp(-0.00368208 * cp)) - 1)
+
+def move_accuracy(win_before, win_after):
+    """Lichess-style accuracy (0-100) of a move from the mover's winning chances before and after it."""
+    return max(0.0, min(100.0, 103.1668 * math.exp(-0.04354 * max(0.0, win_before - win_after)) - 3.1669))
+
+def side_summary(analysis, color):
+    """Aggregates one colour's plies of a PackedAnalysis into a game_analysis row's values. Book moves are not counted."""
+    white = color == "white"
+    own = [i for i in range(len(analysis)) if analysis.white_to_move(i) == white and analysis.quality(i) != "Book"]
+    counts = Counter(analysis.quality(i) for i in own)
+    accuracies = []
+    for i in own:
+        before, after = win_percent(white_cp(analysis.scores[i])), win_percent(white_cp(analysis.scores[i + 1]))
+        accuracies.append(move_accuracy(before, after) if white else move_accuracy(100 - before, 100 - after))
+    return {
+        "moves": len(own),
+        "accuracy": sum(accuracies) / len(own) if own else None,
+        "avg_cp_loss": sum(max(0, analysis.cp_loss(i)) for i in own) / len(own) if own else None,
+        **{column: counts[quality] for quality, column in QUALITY_COLUMNS.items()},
+    }
+
+# --- PERSISTENCE ---
+def pending_games(username, db_name=DB_NAME):
+    """(url, pgn) of the player's standard-chess games that have not been analysed yet, newest first."""
+    username = username.lower()
+    return reader(db_name).execute('''
+        SELECT url, pgn FROM archive.games g
+        WHERE (white_username = ? OR black_username = ?) AND rules = 'chess' AND pgn IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM game_analysis a WHERE a.url = g.url)
+        ORDER BY end_time DESC
+    ''', (username, username)).fetchall()
+
+def save_analysis(conn, url, analysis, depth, nodes):
+    """Stores a game's PackedAnalysis and its per-colour summaries. Games without moves still get summary rows so they are not retried."""
+    now = int(time.time())
+    conn.execute("INSERT OR REPLACE INTO analysis_data (url, data) VALUES (?, ?)", (url, analysis.to_bytes()))
+    for color in ("white", "black"):
+        summary = side_summary(analysis, color)
+        conn.execute('''
+            INSERT OR REPLACE INTO game_analysis (url, color, analyzed_at, depth, nodes, moves, accuracy, avg_cp_loss,
+                                                  excellent, good, inaccuracies, mistakes, blunders)
+            VALUES (:url, :color, :analyzed_at, :depth, :nodes, :moves, :accuracy, :avg_cp_loss,
+                    :excellent, :good, :inaccuracies, :mistakes, :blunders)
+        ''', {"url": url, "color": color, "analyzed_at": now, "depth": depth, "nodes": nodes, **summary})
+
+def load_analysis(url, db_name=DB_NAME):
+    """The stored PackedAnalysis of a game, or None if it has not been analysed."""
+    row = reader(db_name).execute("SELECT data FROM analysis_data WHERE url = ?", (url,)).fetchone()
+    return PackedAnalysis.from_bytes(row[0]) if row else None
+
+# --- BATCH JOB ---
+def analyze_archive(username, path, db_name=DB_NAME, workers=ANALYSIS_WORKERS, depth=ANALYSIS_DEPTH, nodes=ANALYSIS_NODES,
+                    cache_path=EVAL_CACHE_DB, limit=None, on_progress=None):
+    """Analyses every stored game of a player that has no analysis yet on the engine process pool.
+
+    Positions of BATCH_GAMES games are queued at once and each game is committed
+    as soon as its results are in, so an interrupted run resumes where it
+    stopped. A game that fails to parse or analyse is reported and left for the
+    next run. `on_progress(done, total)` is called after each game. Returns the
+    number of games analysed.
+    """
+    pending = pending_games(username, db_name)[:limit]
+    analysed = done = 0
+    for start in range(0, len(pending), BATCH_GAMES):
+        queued = []
+        for url, pgn in pending[start:start + BATCH_GAMES]:
+            game = chess.pgn.read_game(io.StringIO(pgn))
+            if game is None or game.errors:
+                print(f"  ERROR (unreadable PGN for {url})")
+                done += 1
+                continue
+            moves, boards = game_positions(game)
+            queued.append((url, boards[0].fen(), moves, position_results_parallel(path, boards, workers, depth, nodes, cache_path)))
+        for url, start_fen, moves, results in queued:
+            done += 1
+            try:
+                analysis, _ = PackedAnalysis.from_results(start_fen, moves, results)
+                with transaction(db_name) as conn: save_analysis(conn, url, analysis, depth, nodes)
+                analysed += 1
+            except Exception as e:
+                print(f"  ERROR (analysing {url}): {e!r}")
+            if on_progress: on_progress(done, len(pending))
+    return analysed
+
+if __name__ == "__main__":
+    # python batch_analysis.py <chess.com username> [max games]
+    stockfish_path = os.environ.get("STOCKFISH_PATH") or shutil.which("stockfish") or "/usr/games/stockfish"
+    username, limit = sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else None
+    count = analyze_archive(username, stockfish_path, limit=limit,
+                            on_progress=lambda done, total: print(f"\r{done}/{total} games", end="", flush=True))
+    print(f"\nAnalysed {count} games for {username}.")
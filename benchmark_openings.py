@@ -0,0 +1,55 @@
+import sys
+import time
+import requests
+from openings import OpeningBook, OpeningIndex, san_tokens, movetext
+
+# --- CONFIGURATION ---
+HEADERS = {"User-Agent": "ChessDashboard/OpeningBenchmark"}
+USAGE = "Usage: python benchmark_openings.py <games.pgn> | --user <chess.com username>"
+
+# --- GAME SOURCES ---
+def read_pgn_file(path):
+    """Splits a multi-game PGN export into one string per game."""
+    with open(path, encoding="utf-8") as f: text = f.read()
+    return ["[Event" + chunk for chunk in text.split("[Event")[1:]]
+
+def fetch_archived_games(username):
+    """Downloads every monthly archive of a Chess.com player and returns the PGN of each game."""
+    archives = requests.get(f"https://api.chess.com/pub/player/{username}/games/archives", headers=HEADERS).json().get("archives", [])
+    pgns = []
+    for url in archives:
+        print(f"Fetching {url}...")
+        pgns.extend(g["pgn"] for g in requests.get(url, headers=HEADERS).json().get("games", []) if g.get("pgn"))
+    return pgns
+
+# --- CLASSIFIERS ---
+def classify_linear(pgn_map, pgn_text):
+    """The previous approach: joins the first moves and prefix-scans every book line."""
+    moves = list(san_tokens(movetext(pgn_text)))[:10]
+    numbered = " ".join(f"{i // 2 + 1}. {san}" if i % 2 == 0 else san for i, san in enumerate(moves))
+    for pgn_prefix, name in pgn_map.items():
+        if numbered.startswith(pgn_prefix): return name
+    return None
+
+def benchmark(label, classify, games):
+    start = time.perf_counter()
+    found = sum(1 for pgn in games if classify(pgn))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<20} {len(games) / elapsed:>12,.0f} games/s   ({found}/{len(games)} classified in {elapsed:.3f}s)")
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == "--user": games = fetch_archived_games(sys.argv[2])
+    elif len(sys.argv) == 2: games = read_pgn_file(sys.argv[1])
+    else: print(USAGE); sys.exit(1)
+    if not games: print("No games found."); sys.exit(1)
+
+    pgn_map = OpeningBook().pgn_map
+    start = time.perf_counter()
+    index = OpeningIndex.from_pgn_map(pgn_map)
+    print(f"Built trie of {index.size} openings in {1000 * (time.perf_counter() - start):.1f} ms\n")
+
+    benchmark("Linear prefix scan", lambda pgn: classify_linear(pgn_map, pgn), games)
+    benchmark("Opening trie", index.classify_pgn, games)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import chess
+import chess.svg
+
+# --- CONFIGURATION ---
+# A rendered board is about 30 KB of SVG (piece definitions included), so the default holds about 30 MB.
+RENDER_CACHE_SIZE = int(os.environ.get("BOARD_RENDER_CACHE_SIZE", 1024))
+# Plies either side of the one on screen that are rendered ahead of a Previous/Next click.
+PREFETCH_PLIES = 2
+
+_prefetcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="board-prefetch")
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def render_svg(fen, arrows=(), orientation=chess.WHITE, size=400):
+    """Renders a position to SVG markup, memoized per process.
+
+    `arrows` is a tuple of (from_square, to_square, color) so the whole call is hashable.
+    """
+    arrows = [chess.svg.Arrow(tail, head, color=color) for tail, head, color in arrows]
+    return chess.svg.board(chess.Board(fen), arrows=arrows, orientation=orientation, size=size)
+
+def board_svg(board, size=400, orientation=chess.WHITE):
+    """The memoized SVG of a board without arrows."""
+    return render_svg(board.fen(), (), orientation, size)
+
+def prefetch(frames):
+    """Renders (fen, arrows, orientation, size) frames on a background thread so later requests are cache hits."""
+    for frame in frames: _prefetcher.submit(render_svg, *frame)
+
+def analysis_frame(analysis, ply, arrow_color, size=400, orientation=chess.WHITE, arrow_offset=0):
+    """The render arguments for position `ply` of a PackedAnalysis, with the engine's best move as an arrow.
+
+    The arrow is the best move at position `ply + arrow_offset` (e.g. -1 for the move
+    that should have been played instead of the last one), if it has been analysed.
+    """
+    arrow_ply = max(0, ply + arrow_offset)
+    top_moves = analysis.top_moves_at(arrow_ply) if arrow_ply < len(analysis) else []
+    arrows = ()
+    if top_moves:
+        move = chess.Move.from_uci(top_moves[0]["Move"])
+        arrows = ((move.from_square, move.to_square, arrow_color),)
+    return analysis.fens()[ply], arrows, orientation, size
+
+def analysis_svg(analysis, ply, arrow_color, size=400, orientation=chess.WHITE, arrow_offset=0):
+    """The SVG for position `ply` of a game review, prefetching the neighbouring plies in the background."""
+    frame = analysis_frame(analysis, ply, arrow_color, size, orientation, arrow_offset)
+    last = analysis.total_plies
+    prefetch(analysis_frame(analysis, neighbour, arrow_color, size, orientation, arrow_offset)
+             for neighbour in range(max(0, ply - PREFETCH_PLIES), min(last, ply + PREFETCH_PLIES) + 1) if neighbour != ply)
+    return render_svg(*frame)
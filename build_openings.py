@@ -0,0 +1,40 @@
+import os
+import sqlite3
+from openings import OPENINGS_DB
+
+def build_opening_table(path=OPENINGS_DB):
+    """Compiles the Lichess opening dataset into the compact SQLite table loaded by openings.OpeningBook.
+
+    Needs `datasets` and network access. The Build Opening Table workflow runs it
+    and commits the result; until openings.db is in the repository, the dashboards
+    run it once on their first load.
+    """
+    # Imported here so the dashboards never pay for the `datasets` stack unless they must build the table.
+    from datasets import load_dataset
+    ds = load_dataset("Lichess/chess-openings", split="train")
+    rows = [(row["eco"], row["name"], row["pgn"]) for row in ds]
+
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path): os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        with conn:
+            conn.execute('''
+                CREATE TABLE openings (
+                    id INTEGER PRIMARY KEY,
+                    eco TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    pgn TEXT NOT NULL
+                )
+            ''')
+            conn.executemany("INSERT INTO openings (eco, name, pgn) VALUES (?, ?, ?)", rows)
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    # Swap the finished file in atomically so a running dashboard never sees a half-written table.
+    os.replace(tmp_path, path)
+    return len(rows)
+
+if __name__ == '__main__':
+    count = build_opening_table()
+    print(f"Opening table `{os.path.basename(OPENINGS_DB)}` built with {count} openings.")
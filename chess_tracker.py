@@ -1,4 +1,6 @@
 import requests
+import httpx
+from chesscom import get_json_blocking
 import pandas as pd
 from datetime import datetime
 
@@ -21,16 +23,15 @@ def get_chesscom_ratings(username):
 
     try:
         url = f"https://api.chess.com/pub/player/{username}/stats"
-        response = requests.get(url, headers={"User-Agent": "MyChessTracker/1.0"})
-        response.raise_for_status()  # Will raise an HTTPError for bad responses (4xx or 5xx)
-        data = response.json()
+        # Rate limited and retried on 429/5xx; raises httpx.HTTPStatusError for other bad responses
+        data = get_json_blocking(url, headers={"User-Agent": "MyChessTracker/1.0"})
 
         return {
             "Rapid": data.get("chess_rapid", {}).get("last", {}).get("rating", "N/A"),
             "Blitz": data.get("chess_blitz", {}).get("last", {}).get("rating", "N/A"),
             "Bullet": data.get("chess_bullet", {}).get("last", {}).get("rating", "N/A"),
         }
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"Error fetching Chess.com data for {username}: {e}")
         return {"Rapid": "Error", "Blitz": "Error", "Bullet": "Error"}
 
@@ -0,0 +1,147 @@
+import asyncio
+import random
+import threading
+import time
+from collections import Counter
+import httpx
+from http_cache import shared_cache
+
+# --- CONFIGURATION ---
+HEADERS = {"User-Agent": "ChessDashboard/ChessComClient"}
+# Process-wide request budget. Chess.com serves serial requests freely and throttles parallel bursts with 429s.
+RATE_PER_SECOND = 5.0
+BURST = 10
+MAX_CONCURRENT_REQUESTS = 8
+MAX_RETRIES = 4
+BACKOFF_BASE_SECONDS = 1.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+CONDITIONAL_HEADERS = {"if-none-match", "if-modified-since"}
+
+# --- RATE LIMITING ---
+class TokenBucket:
+    """A thread-safe token bucket shared by every client in the process, whichever event loop it runs on."""
+
+    def __init__(self, rate=RATE_PER_SECOND, capacity=BURST):
+        self.rate, self.capacity = rate, capacity
+        self._tokens, self._updated = float(capacity), time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Takes a token (possibly going into debt) and returns how long the caller must wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = max(0.0, -self._tokens / self.rate)
+            return max(wait, self._paused_until - now)
+
+    def pause(self, seconds):
+        """Stops all requests for `seconds`, e.g. when the server sends Retry-After."""
+        with self._lock: self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        """Waits for a token. Returns the time spent waiting."""
+        wait = self._reserve()
+        if wait > 0: await asyncio.sleep(wait)
+        return wait
+
+RATE_LIMITER = TokenBucket()
+
+def retry_delay(response, attempt):
+    """Honours a numeric Retry-After header, otherwise backs off exponentially with jitter."""
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.isdigit(): return float(retry_after)
+    return BACKOFF_BASE_SECONDS * (2 ** attempt) + random.uniform(0, BACKOFF_BASE_SECONDS)
+
+# --- CLIENT ---
+class ChessComClient:
+    """Wraps an httpx.AsyncClient with Chess.com-friendly behaviour.
+
+    - Identical requests already in flight are coalesced: later callers await the first one's response.
+    - Every request takes a token from the process-wide bucket; a 429 pauses the whole bucket for its Retry-After.
+    - 429s, 5xx and transport errors are retried with backoff.
+    - Successful responses go to the disk-backed HTTP cache (the process-wide one unless
+      `cache` is given): fresh entries are served locally and stale ones are revalidated
+      with a conditional GET, so unchanged data costs a 304. Requests that carry their
+      own validators (e.g. the archive sync's If-None-Match) bypass the cache, and
+      `revalidate=True` skips serving a fresh entry so the server is always asked.
+
+    `get(url, headers=None, revalidate=False)` returns an httpx.Response like the wrapped client, so it can
+    be passed anywhere an AsyncClient is used for GETs. Use one instance per event loop.
+    """
+
+    def __init__(self, client, headers=None, cache=None, limiter=RATE_LIMITER, max_concurrency=MAX_CONCURRENT_REQUESTS, max_retries=MAX_RETRIES):
+        self.client, self.limiter, self.max_retries = client, limiter, max_retries
+        self.cache = cache or shared_cache()
+        self.headers = {**HEADERS, **(headers or {})}
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._inflight = {}
+        self._metrics = Counter()
+
+    async def get(self, url, headers=None, revalidate=False):
+        headers = {**self.headers, **(headers or {})}
+        cacheable = not CONDITIONAL_HEADERS & {name.lower() for name in headers}
+        cached, fresh = self.cache.lookup(url) if cacheable else (None, False)
+        if fresh and not revalidate:
+            self._metrics["cache_hits"] += 1
+            return cached
+        key = (url, tuple(sorted(headers.items())))
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self._metrics["coalesced"] += 1
+            return await asyncio.shield(inflight)
+        task = asyncio.ensure_future(self._fetch_cached(url, headers, cached) if cacheable else self._fetch(url, headers))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def get_json(self, url, headers=None, revalidate=False):
+        """GETs a JSON document, raising httpx.HTTPStatusError on an error status."""
+        response = await self.get(url, headers, revalidate)
+        response.raise_for_status()
+        return response.json()
+
+    async def _fetch_cached(self, url, headers, cached):
+        """Fetches through the HTTP cache, revalidating a stale `cached` entry instead of downloading it again."""
+        response = await self._fetch(url, {**headers, **self.cache.conditional_headers(cached)} if cached else headers)
+        if cached is not None and response.status_code == 304:
+            self._metrics["revalidated"] += 1
+            self.cache.refresh(url, response)
+            return cached
+        if response.status_code == 200:
+            self._metrics["cache_misses"] += 1
+            self.cache.store(url, response)
+        return response
+
+    async def _fetch(self, url, headers):
+        for attempt in range(self.max_retries + 1):
+            async with self._semaphore:
+                if await self.limiter.acquire() > 0: self._metrics["throttled"] += 1
+                self._metrics["requests"] += 1
+                try:
+                    response = await self.client.get(url, headers=headers)
+                except httpx.TransportError:
+                    self._metrics["transport_errors"] += 1
+                    if attempt == self.max_retries: raise
+                    response = None
+            status = response.status_code if response is not None else None
+            if status == 304: self._metrics["not_modified"] += 1
+            if status is not None and status not in RETRY_STATUSES: return response
+            if status == 429: self._metrics["rate_limited"] += 1
+            if attempt == self.max_retries: return response
+            delay = retry_delay(response, attempt)
+            if status == 429: self.limiter.pause(delay)
+            self._metrics["retries"] += 1
+            await asyncio.sleep(delay)
+
+    def metrics(self):
+        """Counters: requests sent, cache hits/misses/revalidations, coalesced duplicates, token waits, 429s, retries, 304s and transport errors."""
+        return dict(self._metrics)
+
+def get_json_blocking(url, headers=None):
+    """One-off GET for synchronous scripts, still subject to the shared rate limit and retries."""
+    async def fetch():
+        async with httpx.AsyncClient() as client: return await ChessComClient(client).get_json(url, headers)
+    return asyncio.run(fetch())
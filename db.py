@@ -0,0 +1,88 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from migrations import migrate, create_archive
+
+# --- CONFIGURATION ---
+DB_NAME = "chess_ratings.db"
+# The Chess.com game archives (PGN included) live in a sidecar next to the ratings database, attached to
+# every connection as "archive", so the committed database only carries ratings derived from them.
+GAMES_DB = os.environ.get("GAMES_DB", "games_archive.db")
+BUSY_TIMEOUT_MS = 10000
+CACHED_STATEMENTS = 256
+# Applied to every connection. WAL lets the dashboard keep reading while the updater writes;
+# NORMAL sync is durable across application crashes in WAL mode and avoids an fsync per commit.
+PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+]
+
+_local = threading.local()
+_migrated = set()
+_migrate_lock = threading.Lock()
+
+# --- CONNECTIONS ---
+def archive_path(path=DB_NAME):
+    """The games archive belonging to the database at `path`: GAMES_DB in the same directory."""
+    return os.path.join(os.path.dirname(path), GAMES_DB)
+
+def ensure_schema(path=DB_NAME):
+    """Runs pending migrations once per process and database file, and creates the archive tables if its sidecar is new."""
+    if path in _migrated: return
+    with _migrate_lock:
+        if path in _migrated: return
+        conn = connect(path, migrate_schema=False)
+        try:
+            migrate(conn)
+            with conn: create_archive(conn)
+        finally: conn.close()
+        _migrated.add(path)
+
+def connect(path=DB_NAME, migrate_schema=True):
+    """Opens a new connection with the games archive attached, the shared pragmas and statement cache. The caller closes it."""
+    if migrate_schema: ensure_schema(path)
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, cached_statements=CACHED_STATEMENTS)
+    # Attached before the pragmas, so WAL mode applies to the archive too.
+    conn.execute("ATTACH DATABASE ? AS archive", (archive_path(path),))
+    for pragma in PRAGMAS: conn.execute(pragma)
+    return conn
+
+def _thread_connection(path, role):
+    """Returns this thread's long-lived connection for `role`, opening it on first use."""
+    connections = getattr(_local, "connections", None)
+    if connections is None: connections = _local.connections = {}
+    conn = connections.get((path, role))
+    if conn is None:
+        conn = connections[(path, role)] = connect(path)
+        if role == "read": conn.execute("PRAGMA query_only = ON")
+    return conn
+
+def reader(path=DB_NAME):
+    """Returns this thread's read-only connection. In WAL mode it never waits on the writer."""
+    return _thread_connection(path, "read")
+
+@contextmanager
+def transaction(path=DB_NAME):
+    """Yields this thread's write connection inside BEGIN IMMEDIATE; commits on success, rolls back on error.
+
+    Taking the write lock up front means a busy database is waited on (up to the
+    busy timeout) at BEGIN rather than failing halfway through the block.
+    """
+    conn = _thread_connection(path, "write")
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+def checkpoint(path=DB_NAME):
+    """Folds the write-ahead log back into the database file so the .db alone is complete (e.g. before committing it)."""
+    conn = connect(path, migrate_schema=False)
+    try: return conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+    finally: conn.close()
@@ -0,0 +1,101 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from stockfish import Stockfish
+
+# --- CONFIGURATION ---
+# Every value can be overridden from the environment so the analysis box and
+# Streamlit Cloud can run with different engine budgets.
+ENGINE_POOL_SIZE = int(os.environ.get("ENGINE_POOL_SIZE", 2))
+ENGINE_THREADS = int(os.environ.get("ENGINE_THREADS", 2))
+ENGINE_HASH_MB = int(os.environ.get("ENGINE_HASH_MB", 256))
+ENGINE_DEPTH = int(os.environ.get("ENGINE_DEPTH", 15))
+CHECKOUT_TIMEOUT = float(os.environ.get("ENGINE_CHECKOUT_TIMEOUT", 60))
+
+
+class EnginePool:
+    """A thread-safe pool of warm Stockfish processes shared by every session."""
+
+    def __init__(self, path, size=ENGINE_POOL_SIZE, threads=ENGINE_THREADS, hash_mb=ENGINE_HASH_MB, depth=ENGINE_DEPTH):
+        self.path, self.size, self.depth = path, size, depth
+        self.parameters = {"Threads": threads, "Hash": hash_mb}
+        # Idle engines, most recently returned last. The condition is notified whenever an engine is
+        # returned or a slot is freed, so a waiting checkout can take the engine or spawn a new one.
+        self._idle = []
+        self._available = threading.Condition()
+        self._created = 0
+
+    def _spawn(self):
+        # turn_perspective=False: scores are White-relative, which is what the analysis code expects.
+        return Stockfish(path=self.path, depth=self.depth, parameters=self.parameters, turn_perspective=False)
+
+    @staticmethod
+    def _is_healthy(engine):
+        """Checks that the engine process is still alive and answering."""
+        try:
+            process = getattr(engine, "_stockfish", None)
+            if process is not None and process.poll() is not None: return False
+            # Round-trips a "d" (board display) through the UCI pipe without starting a search.
+            engine.get_fen_position()
+            return True
+        except Exception:
+            return False
+
+    def _release(self, engine):
+        with self._available:
+            self._idle.append(engine)
+            self._available.notify()
+
+    def _free_slot(self):
+        with self._available:
+            self._created -= 1
+            self._available.notify()
+
+    def _discard(self, engine):
+        self._free_slot()
+        try: engine.send_quit_command()
+        except Exception: pass
+
+    def _acquire(self, timeout):
+        """Returns an idle engine, spawning one if the pool has not reached its size yet.
+
+        Waits up to `timeout` seconds in total for an engine to be returned or a
+        slot to be freed by a discarded one, then raises TimeoutError.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._available:
+                if not self._available.wait_for(lambda: self._idle or self._created < self.size, deadline - time.monotonic()):
+                    raise TimeoutError(f"No Stockfish engine became available within {timeout}s.")
+                engine = self._idle.pop() if self._idle else None
+                if engine is None: self._created += 1
+            if engine is None:
+                try: return self._spawn()
+                except Exception:
+                    self._free_slot()
+                    raise
+            if self._is_healthy(engine): return engine
+            self._discard(engine)
+
+    @contextmanager
+    def checkout(self, timeout=CHECKOUT_TIMEOUT):
+        """Lends an engine for the duration of a `with` block and returns it afterwards."""
+        engine = self._acquire(timeout)
+        clean = False
+        try:
+            yield engine
+            clean = True
+        finally:
+            # After an error, or a generator closed mid-search (GeneratorExit), the engine
+            # may be in an unknown state; replace it. Either way its slot is released.
+            if clean: self._release(engine)
+            else: self._discard(engine)
+
+    def close(self):
+        """Shuts down every idle engine in the pool."""
+        with self._available: idle, self._idle = self._idle, []
+        for engine in idle: self._discard(engine)
+
+    def stats(self):
+        with self._available: return {"size": self.size, "created": self._created, "idle": len(self._idle)}
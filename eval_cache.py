@@ -0,0 +1,69 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+# --- CONFIGURATION ---
+# Kept in a sidecar file so the engine cache never bloats the committed ratings database.
+EVAL_CACHE_DB = os.environ.get("EVAL_CACHE_DB", "eval_cache.db")
+EVAL_CACHE_MAX_ENTRIES = int(os.environ.get("EVAL_CACHE_MAX_ENTRIES", 500000))
+EVICTION_CHECK_INTERVAL = 1000
+
+def normalize_fen(fen):
+    """Drops the halfmove clock and fullmove number so transposed move orders share an entry."""
+    return " ".join(fen.split()[:4])
+
+def search_key(engine, depth, nodes=None, top_n=3):
+    """Describes the search settings a cached result is valid for, e.g. "sf16/d15/pv3"."""
+    budget = f"n{nodes}" if nodes else f"d{depth}"
+    return f"sf{engine.get_stockfish_major_version()}/{budget}/pv{top_n}"
+
+
+class EvalCache:
+    """A size-bounded, least-recently-used cache of engine results keyed by FEN and search settings."""
+
+    def __init__(self, path=EVAL_CACHE_DB, max_entries=EVAL_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._puts_since_check = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS evaluations (
+                    fen TEXT NOT NULL,
+                    search TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (fen, search)
+                ) WITHOUT ROWID
+            ''')
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_evaluations_last_used ON evaluations (last_used)")
+
+    def get(self, fen, search):
+        """Returns the cached result for a position, or None on a miss."""
+        key = normalize_fen(fen)
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT result FROM evaluations WHERE fen = ? AND search = ?", (key, search)).fetchone()
+            if row is None: return None
+            self._conn.execute("UPDATE evaluations SET last_used = ? WHERE fen = ? AND search = ?", (time.time(), key, search))
+        return json.loads(row[0])
+
+    def put(self, fen, search, result):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO evaluations (fen, search, result, last_used) VALUES (?, ?, ?, ?)",
+                               (normalize_fen(fen), search, json.dumps(result), time.time()))
+            self._puts_since_check += 1
+            if self._puts_since_check >= EVICTION_CHECK_INTERVAL:
+                self._puts_since_check = 0
+                self._evict()
+
+    def _evict(self):
+        """Deletes the least recently used entries beyond the size limit."""
+        excess = self._conn.execute("SELECT COUNT(*) FROM evaluations").fetchone()[0] - self.max_entries
+        if excess > 0:
+            self._conn.execute("DELETE FROM evaluations WHERE (fen, search) IN (SELECT fen, search FROM evaluations ORDER BY last_used LIMIT ?)", (excess,))
+
+    def close(self):
+        with self._lock: self._conn.close()
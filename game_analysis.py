@@ -0,0 +1,305 @@
+import os
+import time
+import math
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import lru_cache
+import chess
+from stockfish import Stockfish
+from eval_cache import EvalCache, search_key
+
+# --- CONFIGURATION ---
+TOP_MOVES = 3
+ANALYSIS_WORKERS = int(os.environ.get("ANALYSIS_WORKERS", os.cpu_count() or 1))
+ANALYSIS_DEPTH = int(os.environ.get("ANALYSIS_DEPTH", 15))
+ANALYSIS_NODES = int(os.environ.get("ANALYSIS_NODES", 0)) or None
+
+# --- ANALYSIS PROFILES ---
+# `nodes` is the first search of every position, `swing_nodes` the re-search of a position whose
+# evaluation swings, and `seconds` the wall-clock budget for a whole game's engine work.
+ANALYSIS_PROFILES = {
+    "quick": {"nodes": 50_000, "swing_nodes": 250_000, "seconds": 10},
+    "standard": {"nodes": 200_000, "swing_nodes": 1_000_000, "seconds": 30},
+    "deep": {"nodes": 1_000_000, "swing_nodes": 5_000_000, "seconds": 120},
+}
+DEFAULT_PROFILE = os.environ.get("ANALYSIS_PROFILE", "standard")
+# A change this large (in centipawns) from the previous position earns a deeper re-search. With
+# White-relative scores the change is the centipawn loss of the move played, so this is classify_move's
+# Mistake threshold: moves about to be labelled Mistake or Blunder are confirmed by the deeper search.
+SWING_CP = 100
+# Base searches are halved from the profile's `nodes` when a game runs behind, down to this floor.
+MIN_NODES = 10_000
+MATE_SWING_CP = 10_000
+
+# --- ENGINE SEARCH ---
+def evaluate_position(engine, board, top_n=TOP_MOVES, nodes=None, cache=None, search=None):
+    """Searches a position exactly once with MultiPV and returns its evaluation and top moves.
+
+    Terminal positions are scored without touching the engine, and positions found
+    in `cache` under the `search` key are answered from it. The second value is the
+    number of engine searches performed (0 or 1).
+    """
+    if board.is_checkmate(): return {"evaluation": {"type": "mate", "value": 0}, "top_moves": []}, 0
+    if board.is_stalemate() or board.is_insufficient_material(): return {"evaluation": {"type": "cp", "value": 0}, "top_moves": []}, 0
+    fen = board.fen()
+    if cache is not None:
+        cached = cache.get(fen, search)
+        if cached is not None: return cached, 0
+    engine.set_fen_position(fen)
+    top_moves = engine.get_top_moves(top_n, num_nodes=nodes) if nodes else engine.get_top_moves(top_n)
+    if not top_moves: return {"evaluation": {"type": "cp", "value": 0}, "top_moves": []}, 1
+    best = top_moves[0]
+    evaluation = {"type": "mate", "value": best["Mate"]} if best.get("Mate") is not None else {"type": "cp", "value": best["Centipawn"]}
+    result = {"evaluation": evaluation, "top_moves": top_moves}
+    if cache is not None: cache.put(fen, search, result)
+    return result, 1
+
+# --- MOVE CLASSIFICATION ---
+def classify_move(eval_loss):
+    """Maps a centipawn loss to a move quality label."""
+    return "Excellent" if eval_loss < 20 else "Good" if eval_loss < 50 else "Inaccuracy" if eval_loss < 100 else "Mistake" if eval_loss < 200 else "Blunder"
+
+def generate_move_comment(move_data):
+    """Generates a more detailed, human-readable comment for a move's quality."""
+    quality = move_data['move_quality']
+    best_move = move_data['best_move']
+    played_move = move_data['move']
+    eval_loss = move_data['eval_loss']
+
+    if quality == "Book":
+        return "A book move from established opening theory."
+    elif quality == "Excellent":
+        return "Excellent! You found the best move." if played_move == best_move else "An excellent move! Keeps the advantage."
+    elif quality == "Good":
+        return "A good solid move."
+    elif quality == "Inaccuracy":
+        return f"An inaccuracy. The best move was {best_move}, which was slightly better."
+    elif quality == "Mistake":
+        return f"A mistake. You missed the better move, {best_move}. This move loses an advantage of {eval_loss:.2f} pawns."
+    elif quality == "Blunder":
+        return f"A major blunder! This move significantly worsens your position. The best move was {best_move}."
+    return ""
+
+def build_move_data(ply, board, move, before, after):
+    """Builds one ply's analysis from the shared search results of the positions around it.
+
+    `board` is the position before `move` is played.
+    """
+    turn = "White" if board.turn == chess.WHITE else "Black"
+    top_moves = before["top_moves"]
+    eval_before, eval_after = before["evaluation"].get('value'), after["evaluation"].get('value')
+    eval_loss = 0
+    if before["evaluation"]["type"] == "cp" and after["evaluation"]["type"] == "cp":
+        eval_loss = (eval_before - eval_after) if turn == "White" else (eval_after - eval_before)
+    move_data = {
+        'ply': ply, 'move_number': (ply - 1) // 2 + 1, 'color': turn,
+        'move': board.san(move), 'best_move': board.san(chess.Move.from_uci(top_moves[0]['Move'])) if top_moves else "N/A",
+        'eval_before': eval_before, 'eval_after': eval_after, 'eval_loss': eval_loss / 100.0,
+        'move_quality': classify_move(eval_loss), 'top_moves': top_moves
+    }
+    move_data['comment'] = generate_move_comment(move_data)
+    return move_data
+
+# --- GAME PIPELINE ---
+def opening_plies(game, index):
+    """How many of a game's first moves follow the opening book (an openings.OpeningIndex)."""
+    board, sans = game.board(), []
+    for move in game.mainline_moves():
+        sans.append(board.san(move))
+        board.push(move)
+    return index.book_plies(sans)
+
+def game_positions(game):
+    """Returns the moves of a game's mainline and the board before and after each of them."""
+    board, moves, boards = game.board(), list(game.mainline_moves()), [game.board()]
+    for move in moves:
+        board.push(move)
+        boards.append(board.copy(stack=False))
+    return moves, boards
+
+def stream_analysis(moves, boards, results):
+    """Yields (move_data, engine_calls) for each ply as soon as the positions around it have been searched.
+
+    `results` yields (result, engine_calls) per position in position order.
+    """
+    results = iter(results)
+    before, calls = next(results)
+    for i, move in enumerate(moves):
+        after, after_calls = next(results)
+        yield build_move_data(i + 1, boards[i], move, before, after), calls + after_calls
+        before, calls = after, 0
+
+def assemble_analysis(moves, boards, results, on_progress=None):
+    """Collects a whole game's move_data in ply order. Returns (analysis, states, engine_calls)."""
+    analysis, engine_calls = [], 0
+    for i, (move_data, calls) in enumerate(stream_analysis(moves, boards, results)):
+        analysis.append(move_data)
+        engine_calls += calls
+        if on_progress: on_progress(i, len(moves), boards[i])
+    return analysis, [board.fen() for board in boards], engine_calls
+
+def position_results(engine, boards, nodes=None, cache=None, depth=ANALYSIS_DEPTH, profile=None, book_plies=0):
+    """Lazily searches each position on one engine.
+
+    `depth` must match the engine's configured depth so cached results are keyed
+    correctly. With a `profile` the node budgets come from budgeted_results instead
+    of `nodes`, and the first `book_plies` positions are not searched.
+    """
+    if profile is not None:
+        def submit(board, budget):
+            future = Future()
+            search = search_key(engine, depth, budget) if cache is not None else None
+            future.set_result(evaluate_position(engine, board, nodes=budget, cache=cache, search=search))
+            return future
+        return budgeted_results(submit, boards, profile, book_plies)
+    search = search_key(engine, depth, nodes) if cache is not None else None
+    return (evaluate_position(engine, board, nodes=nodes, cache=cache, search=search) for board in boards)
+
+def analyze_game(engine, game, on_progress=None, nodes=None, cache=None, depth=ANALYSIS_DEPTH):
+    """Analyzes every ply of a parsed game on one engine, searching each position exactly once.
+
+    The result of position N is reused as the "after" evaluation of ply N and the
+    "before" evaluation of ply N+1. Returns (analysis, states, engine_calls).
+    """
+    moves, boards = game_positions(game)
+    return assemble_analysis(moves, boards, position_results(engine, boards, nodes, cache, depth), on_progress)
+
+# --- BUDGETED SEARCH ---
+def swing_score(evaluation):
+    """A score for comparing consecutive positions, with mates as a very large score.
+
+    Evaluations must be White-relative (engines run with turn_perspective=False);
+    side-to-move scores would differ by about twice the evaluation every ply.
+    """
+    if evaluation["type"] == "cp": return evaluation["value"]
+    return math.copysign(MATE_SWING_CP, evaluation["value"]) if evaluation["value"] else MATE_SWING_CP
+
+
+class SearchBudget:
+    """Hands out node budgets so a game's engine work fits its profile's wall-clock budget.
+
+    Throughput (nodes per second across every engine in use) is measured as
+    results come in. While the game is running behind, base searches are halved
+    (in steps, so they keep sharing evaluation cache entries). A swing position
+    gets its deeper re-search only if the rest of the game still fits.
+    """
+
+    def __init__(self, profile, positions):
+        self.profile = ANALYSIS_PROFILES[profile] if isinstance(profile, str) else profile
+        self.remaining = positions
+        self.started = time.monotonic()
+        self.nodes_searched = 0
+
+    def _rate(self):
+        elapsed = time.monotonic() - self.started
+        return self.nodes_searched / elapsed if self.nodes_searched and elapsed > 0 else None
+
+    def time_left(self):
+        return self.started + self.profile["seconds"] - time.monotonic()
+
+    def base_nodes(self):
+        """Nodes for the next position's first search."""
+        nodes, rate = self.profile["nodes"], self._rate()
+        if rate is None or not self.remaining: return nodes
+        affordable = max(0.0, self.time_left()) * rate / self.remaining
+        while nodes > affordable and nodes // 2 >= MIN_NODES: nodes //= 2
+        return nodes
+
+    def swing_nodes(self):
+        """Nodes for re-searching a swing position, or None when the budget cannot cover it."""
+        rate = self._rate()
+        if rate is None: return None
+        needed = (self.profile["swing_nodes"] + self.remaining * self.profile["nodes"]) / rate
+        return self.profile["swing_nodes"] if needed <= self.time_left() else None
+
+    def searched(self, nodes):
+        self.nodes_searched += nodes
+
+    def position_done(self):
+        self.remaining -= 1
+
+def budgeted_results(submit, boards, profile=DEFAULT_PROFILE, book_plies=0, window=1):
+    """Yields (result, engine_calls) per position in order, spending engine nodes according to `profile`.
+
+    `submit(board, nodes)` starts one search and returns a Future of
+    (result, engine_calls); up to `window` searches are kept in flight. The first
+    `book_plies` positions lead into book moves and yield (None, 0) without a search.
+    A position whose evaluation differs from the previous one by SWING_CP or more is
+    searched again with the profile's `swing_nodes` when the budget allows.
+    """
+    book_plies = min(book_plies, len(boards) - 1)
+    for _ in range(book_plies): yield None, 0
+    budget = SearchBudget(profile, len(boards) - book_plies)
+    positions, in_flight, previous = iter(range(book_plies, len(boards))), deque(), None
+    def fill():
+        for i in positions:
+            nodes = budget.base_nodes()
+            in_flight.append((i, nodes, submit(boards[i], nodes)))
+            if len(in_flight) >= window: return
+    fill()
+    while in_flight:
+        i, nodes, future = in_flight.popleft()
+        # Keep the window full while this result (and any re-search of it) is awaited.
+        fill()
+        result, calls = future.result()
+        budget.searched(nodes if calls else 0)
+        score = swing_score(result["evaluation"])
+        if previous is not None and abs(score - previous) >= SWING_CP:
+            deeper = budget.swing_nodes()
+            if deeper and deeper > nodes:
+                result, more = submit(boards[i], deeper).result()
+                budget.searched(deeper if more else 0)
+                calls += more
+                score = swing_score(result["evaluation"])
+        budget.position_done()
+        previous = score
+        yield result, calls
+
+# --- PARALLEL ANALYSIS ---
+_worker_engine, _worker_cache, _worker_depth = None, None, None
+
+def _init_worker(path, depth, cache_path):
+    """Starts the single-threaded engine (and cache connection) owned by one worker process."""
+    global _worker_engine, _worker_cache, _worker_depth
+    _worker_engine = Stockfish(path=path, depth=depth, parameters={"Threads": 1, "Hash": 64}, turn_perspective=False)
+    _worker_cache = EvalCache(cache_path) if cache_path else None
+    _worker_depth = depth
+
+def _evaluate_fen(task):
+    fen, nodes = task
+    search = search_key(_worker_engine, _worker_depth, nodes) if _worker_cache is not None else None
+    return evaluate_position(_worker_engine, chess.Board(fen), nodes=nodes, cache=_worker_cache, search=search)
+
+@lru_cache(maxsize=None)
+def get_analysis_executor(path, workers=ANALYSIS_WORKERS, depth=ANALYSIS_DEPTH, cache_path=None):
+    """Returns a long-lived process pool with one warm engine per worker.
+
+    Workers are spawned rather than forked so they do not inherit the threads of
+    the Streamlit server.
+    """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                               initializer=_init_worker, initargs=(path, depth, cache_path))
+
+def position_results_parallel(path, boards, workers=ANALYSIS_WORKERS, depth=ANALYSIS_DEPTH, nodes=ANALYSIS_NODES, cache_path=None, profile=None, book_plies=0):
+    """Submits every position to the engine process pool and yields the results in position order.
+
+    Each worker consults the evaluation cache at `cache_path` when one is given.
+    With a `profile`, positions are submitted a few per worker at a time with
+    node budgets from budgeted_results, and the first `book_plies` are skipped.
+    """
+    executor = get_analysis_executor(path, workers, depth, cache_path)
+    if profile is not None:
+        return budgeted_results(lambda board, budget: executor.submit(_evaluate_fen, (board.fen(), budget)),
+                                boards, profile, book_plies, window=2 * workers)
+    return executor.map(_evaluate_fen, [(board.fen(), nodes) for board in boards])
+
+def analyze_game_parallel(path, game, workers=ANALYSIS_WORKERS, depth=ANALYSIS_DEPTH, nodes=ANALYSIS_NODES, on_progress=None, cache_path=None):
+    """Fans the positions of a game out to a pool of engine processes.
+
+    Positions are searched independently with a fixed depth (or node budget when
+    `nodes` is set) and reassembled in ply order. Returns (analysis, states, engine_calls).
+    """
+    moves, boards = game_positions(game)
+    results = position_results_parallel(path, boards, workers, depth, nodes, cache_path)
+    return assemble_analysis(moves, boards, results, on_progress)
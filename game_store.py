@@ -0,0 +1,116 @@
+import asyncio
+from datetime import datetime, timezone
+import httpx
+from db import reader, transaction
+from chesscom import ChessComClient
+
+# --- CONFIGURATION ---
+# Games and archive months are stored in the uncommitted archive sidecar (db.GAMES_DB) attached to this database.
+DB_NAME = "chess_ratings.db"
+HEADERS = {"User-Agent": "ChessDashboard/GameStore"}
+API_ROOT = "https://api.chess.com/pub/player"
+
+GAME_COLUMNS = (
+    "url", "uuid", "end_time", "time_class", "time_control", "rules", "rated",
+    "white_username", "white_rating", "white_result", "white_accuracy",
+    "black_username", "black_rating", "black_result", "black_accuracy",
+    "eco_url", "pgn",
+)
+
+# --- HELPERS ---
+def month_of(archive_url):
+    """Turns ".../games/2024/05" into "2024/05"."""
+    return "/".join(archive_url.rstrip("/").split("/")[-2:])
+
+def current_month():
+    return datetime.now(timezone.utc).strftime("%Y/%m")
+
+def game_row(game):
+    """Flattens one Chess.com archive game into a `games` row."""
+    white, black, accuracies = game.get("white", {}), game.get("black", {}), game.get("accuracies", {}) or {}
+    return (
+        game.get("url"), game.get("uuid"), game.get("end_time"), game.get("time_class"), game.get("time_control"),
+        game.get("rules"), int(bool(game.get("rated"))),
+        white.get("username", "").lower(), white.get("rating"), white.get("result"), accuracies.get("white"),
+        black.get("username", "").lower(), black.get("rating"), black.get("result"), accuracies.get("black"),
+        game.get("eco"), game.get("pgn"),
+    )
+
+def row_to_game(row):
+    """Rebuilds the Chess.com game dict shape the dashboards already understand."""
+    g = dict(zip(GAME_COLUMNS, row))
+    accuracies = {color: g[f"{color}_accuracy"] for color in ("white", "black") if g[f"{color}_accuracy"] is not None}
+    return {
+        "url": g["url"], "uuid": g["uuid"], "end_time": g["end_time"], "time_class": g["time_class"],
+        "time_control": g["time_control"], "rules": g["rules"], "rated": bool(g["rated"]), "eco": g["eco_url"], "pgn": g["pgn"],
+        "white": {"username": g["white_username"], "rating": g["white_rating"], "result": g["white_result"]},
+        "black": {"username": g["black_username"], "rating": g["black_rating"], "result": g["black_result"]},
+        "accuracies": accuracies,
+    }
+
+# --- SYNC ---
+async def _sync_month(client, username, archive_url, known):
+    """Fetches one monthly archive, conditionally if we have seen it before. Returns (month_row, games or None)."""
+    month = month_of(archive_url)
+    etag, last_modified = (known[2], known[3]) if known else (None, None)
+    headers = dict(HEADERS)
+    if etag: headers["If-None-Match"] = etag
+    if last_modified: headers["If-Modified-Since"] = last_modified
+    response = await client.get(archive_url, headers=headers)
+    closed = int(month < current_month())
+    now = int(datetime.now(timezone.utc).timestamp())
+    if response.status_code == 304:
+        return (username, month, archive_url, closed, etag, last_modified, now), None
+    response.raise_for_status()
+    games = response.json().get("games", [])
+    row = (username, month, archive_url, closed, response.headers.get("ETag"), response.headers.get("Last-Modified"), now)
+    return row, games
+
+async def sync_player(username, client=None, db_name=DB_NAME):
+    """Brings the local archive of a player up to date.
+
+    Closed months are never requested again; open months (normally just the
+    current one) are revalidated with ETag / Last-Modified so unchanged archives
+    cost a 304. Returns the number of games written.
+    """
+    username = username.lower()
+    if client is None:
+        async with httpx.AsyncClient() as own_client: return await sync_player(username, ChessComClient(own_client, HEADERS), db_name)
+
+    known = {row[0]: row for row in reader(db_name).execute(
+        "SELECT month, closed, etag, last_modified FROM archive.archive_months WHERE username = ?", (username,))}
+
+    response = await client.get(f"{API_ROOT}/{username}/games/archives", headers=HEADERS)
+    response.raise_for_status()
+    archive_urls = response.json().get("archives", [])
+    pending = [url for url in archive_urls if not (month_of(url) in known and known[month_of(url)][1])]
+    results = await asyncio.gather(*[_sync_month(client, username, url, known.get(month_of(url))) for url in pending])
+
+    written = 0
+    with transaction(db_name) as conn:
+        for month_row, games in results:
+            if games:
+                conn.executemany(f"INSERT OR REPLACE INTO archive.games ({', '.join(GAME_COLUMNS)}) VALUES ({', '.join('?' * len(GAME_COLUMNS))})",
+                                 [game_row(g) for g in games if g.get("url")])
+                written += len(games)
+            conn.execute("INSERT OR REPLACE INTO archive.archive_months VALUES (?, ?, ?, ?, ?, ?, ?)", month_row)
+    return written
+
+# --- QUERIES ---
+def load_games(username, months=None, db_name=DB_NAME):
+    """Returns a player's stored games, newest first, optionally limited to their last `months` archive months."""
+    username = username.lower()
+    conn = reader(db_name)
+    since = 0
+    if months:
+        recent = conn.execute("SELECT month FROM archive.archive_months WHERE username = ? ORDER BY month DESC LIMIT ?", (username, months)).fetchall()
+        if recent:
+            since = int(datetime.strptime(recent[-1][0], "%Y/%m").replace(tzinfo=timezone.utc).timestamp())
+    columns = ", ".join(GAME_COLUMNS)
+    rows = conn.execute(f'''
+        SELECT {columns} FROM archive.games WHERE white_username = ? AND end_time >= ?
+        UNION ALL
+        SELECT {columns} FROM archive.games WHERE black_username = ? AND end_time >= ?
+        ORDER BY end_time DESC
+    ''', (username, since, username, since)).fetchall()
+    return [row_to_game(row) for row in rows]
@@ -0,0 +1,100 @@
+import os
+import re
+import json
+import time
+import zlib
+import sqlite3
+import threading
+from functools import lru_cache
+import httpx
+
+# --- CONFIGURATION ---
+# A sidecar file like the engine cache, so cached API bodies never end up in the committed ratings database.
+HTTP_CACHE_DB = os.environ.get("HTTP_CACHE_DB", "http_cache.db")
+HTTP_CACHE_MAX_ENTRIES = int(os.environ.get("HTTP_CACHE_MAX_ENTRIES", 5000))
+# Used when a response carries no Cache-Control max-age.
+DEFAULT_TTL_SECONDS = 300
+EVICTION_CHECK_INTERVAL = 100
+# Response headers worth replaying from the cache.
+KEPT_HEADERS = ("content-type", "etag", "last-modified", "cache-control")
+
+def max_age(response):
+    """Seconds the response may be served without revalidation, from Cache-Control (no-store/no-cache mean 0)."""
+    cache_control = response.headers.get("Cache-Control", "").lower()
+    if "no-store" in cache_control or "no-cache" in cache_control: return 0
+    match = re.search(r"max-age=(\d+)", cache_control)
+    return int(match.group(1)) if match else DEFAULT_TTL_SECONDS
+
+
+class HttpCache:
+    """A disk-backed cache of successful GET responses keyed by URL, with bodies stored zlib-compressed.
+
+    Entries are fresh for their max-age; stale entries are kept so they can be
+    revalidated with If-None-Match / If-Modified-Since and refreshed on a 304.
+    """
+
+    def __init__(self, path=HTTP_CACHE_DB, max_entries=HTTP_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._stores_since_check = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS responses (
+                    url TEXT PRIMARY KEY,
+                    headers TEXT NOT NULL,
+                    body BLOB NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                ) WITHOUT ROWID
+            ''')
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_fetched_at ON responses (fetched_at)")
+
+    def lookup(self, url):
+        """Returns (response, is_fresh) for a cached URL, or (None, False) on a miss."""
+        with self._lock:
+            row = self._conn.execute("SELECT headers, body, expires_at FROM responses WHERE url = ?", (url,)).fetchone()
+        if row is None: return None, False
+        response = httpx.Response(200, headers=json.loads(row[0]), content=zlib.decompress(row[1]), request=httpx.Request("GET", url))
+        return response, row[2] > time.time()
+
+    def conditional_headers(self, cached):
+        """Validators for revalidating a cached response."""
+        headers = {}
+        if cached.headers.get("ETag"): headers["If-None-Match"] = cached.headers["ETag"]
+        if cached.headers.get("Last-Modified"): headers["If-Modified-Since"] = cached.headers["Last-Modified"]
+        return headers
+
+    def store(self, url, response):
+        """Caches a 200 response (unless marked no-store)."""
+        if response.status_code != 200 or "no-store" in response.headers.get("Cache-Control", "").lower(): return
+        headers = {name: response.headers[name] for name in KEPT_HEADERS if name in response.headers}
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO responses (url, headers, body, fetched_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                               (url, json.dumps(headers), zlib.compress(response.content), now, now + max_age(response)))
+            self._stores_since_check += 1
+            if self._stores_since_check >= EVICTION_CHECK_INTERVAL:
+                self._stores_since_check = 0
+                self._evict()
+
+    def refresh(self, url, not_modified):
+        """Marks a cached entry fresh again after a 304, taking the new max-age if the server sent one."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE responses SET fetched_at = ?, expires_at = ? WHERE url = ?", (now, now + max_age(not_modified), url))
+
+    def _evict(self):
+        """Deletes the least recently fetched entries beyond the size limit."""
+        excess = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+        if excess > 0:
+            self._conn.execute("DELETE FROM responses WHERE url IN (SELECT url FROM responses ORDER BY fetched_at LIMIT ?)", (excess,))
+
+    def close(self):
+        with self._lock: self._conn.close()
+
+@lru_cache(maxsize=None)
+def shared_cache(path=HTTP_CACHE_DB):
+    """One HttpCache per file per process."""
+    return HttpCache(path)
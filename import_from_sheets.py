@@ -2,8 +2,10 @@ import streamlit as st
 import gspread
 from google.oauth2.service_account import Credentials
 import pandas as pd
-import sqlite3
 import os
+from db import connect
+from migrations import to_epoch
+from rating_rollup import rebuild_daily
 
 # --- CONFIGURATION ---
 # This should be the same URL you used in your old scripts.
@@ -72,21 +74,32 @@ def import_history():
 
     # Ensure the columns are in the correct order for the database.
     df = df[['timestamp', 'player_name', 'category', 'rating']]
+    # The view's trigger only parses ISO timestamps, so the Sheets formats are converted here.
+    df['ts'] = df['timestamp'].map(to_epoch).astype('Int64')
+    unparseable = df['ts'].isna()
+    if unparseable.any():
+        print(f"Skipping {unparseable.sum()} rows with unparseable dates, e.g. {df.loc[unparseable, 'timestamp'].iloc[0]!r}.")
+        df = df[~unparseable]
     
     # --- Step 3: Connect and Write to SQLite Database ---
     try:
         print(f"Connecting to SQLite database: '{DB_NAME}'...")
-        with sqlite3.connect(DB_NAME) as conn:
+        with connect(DB_NAME) as conn:
             c = conn.cursor()
             
             # To prevent duplicating data if you run this script more than once,
             # we will delete all existing records from the history table first.
-            print("Clearing existing data from 'rating_history' table...")
-            c.execute("DELETE FROM rating_history;")
+            print("Clearing existing data from 'rating_points' and 'rating_daily' tables...")
+            c.execute("DELETE FROM rating_points;")
+            c.execute("DELETE FROM rating_daily;")
             
-            print(f"Writing {len(df)} new records to the 'rating_history' table...")
+            print(f"Writing {len(df)} new records to the 'rating_history' view...")
             # Use pandas' to_sql function for an efficient bulk insert.
+            # The view's INSTEAD OF trigger resolves player ids and skips duplicate snapshots.
             df.to_sql('rating_history', conn, if_exists='append', index=False)
+
+            print("Rebuilding the daily rating rollup...")
+            rebuild_daily(conn)
             
             print("Verifying write operation...")
             rows_in_db = c.execute("SELECT COUNT(*) FROM rating_history;").fetchone()[0]
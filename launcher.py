@@ -11,7 +11,8 @@ streamlit_app_script = os.path.join(script_dir, 'streamlit_app_sqlite.py') # <--
 
 # Define the commands to run
 # We use sys.executable to ensure we're using the same Python that ran this launcher
-updater_command = [sys.executable, updater_script]
+# --daemon keeps the updater resident, polling each player on an adaptive schedule
+updater_command = [sys.executable, updater_script, '--daemon']
 streamlit_command = [sys.executable, '-m', 'streamlit', 'run', streamlit_app_script]
 
 # Use Popen to launch both scripts in new, separate console windows
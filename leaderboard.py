@@ -0,0 +1,78 @@
+import io
+import json
+import time
+import pandas as pd
+from db import reader, transaction
+from game_store import DB_NAME
+from player_stats import roster_frame, add_openings, outcome_summary
+
+# --- CONFIGURATION ---
+CACHE_KEY = "leaderboard"
+TOP_OPENINGS = 5
+
+# --- BATCH ANALYTICS ---
+def games_signature(conn, usernames):
+    """Changes whenever a roster member's stored games change: their count and the latest end time."""
+    placeholders = ", ".join("?" * len(usernames))
+    count, latest = conn.execute(f'''
+        SELECT COUNT(*), MAX(end_time) FROM archive.games
+        WHERE white_username IN ({placeholders}) OR black_username IN ({placeholders})
+    ''', usernames * 2).fetchone()
+    return f"{','.join(sorted(usernames))}:{count}:{latest}"
+
+def compute_leaderboard(roster, book, db_name=DB_NAME):
+    """Computes every roster member's stats, repertoire and head-to-head record in one pass over the local games.
+
+    All games are loaded as a single frame (one row per roster member per game)
+    and every table is a group-by over it. Returns a dict of DataFrames.
+    """
+    names = {username.lower(): name for name, username in roster}
+    df = add_openings(roster_frame(list(names), db_name), book)
+    df["player"] = df["player"].map(names)
+    df["opponent_name"] = df["opponent"].map(names)
+
+    players = outcome_summary(df, "player")
+    by_color = outcome_summary(df, ["player", "color"])["win_rate"].unstack("color")
+    players = players.join(by_color.add_prefix("win_rate_"))
+    players["last_game"] = df.groupby("player", observed=True)["end_time"].max()
+    players = players.sort_values("win_rate", ascending=False).reset_index()
+
+    openings = (df.groupby(["player", "color", "opening"], observed=True).size().rename("games")
+                .sort_values(ascending=False).groupby(level=["player", "color"], observed=True).head(TOP_OPENINGS)
+                .reset_index().sort_values(["player", "color", "games"], ascending=[True, True, False]))
+
+    rivals = df[df["opponent_name"].notna()]
+    head_to_head = pd.crosstab([rivals["player"], rivals["opponent_name"]], rivals["outcome"])
+    head_to_head = head_to_head.reindex(columns=["win", "draw", "loss"], fill_value=0).rename(columns={"win": "wins", "draw": "draws", "loss": "losses"})
+    head_to_head["games"] = head_to_head.sum(axis=1)
+    head_to_head["score"] = 100 * (head_to_head["wins"] + 0.5 * head_to_head["draws"]) / head_to_head["games"]
+    head_to_head = head_to_head.reset_index().rename(columns={"opponent_name": "opponent"})
+    head_to_head.columns.name = None
+    return {"players": players, "openings": openings, "head_to_head": head_to_head}
+
+def refresh_leaderboard(roster, book, db_name=DB_NAME, force=False):
+    """Recomputes the leaderboard if the roster's games changed since the cached copy. Returns True if it was recomputed."""
+    usernames = [username.lower() for _, username in roster]
+    signature = games_signature(reader(db_name), usernames)
+    cached = reader(db_name).execute("SELECT signature FROM analytics_cache WHERE key = ?", (CACHE_KEY,)).fetchone()
+    if cached and cached[0] == signature and not force: return False
+    tables = compute_leaderboard(roster, book, db_name)
+    payload = json.dumps({name: table.to_json(orient="split", index=False, date_format="iso") for name, table in tables.items()})
+    with transaction(db_name) as conn:
+        conn.execute("INSERT OR REPLACE INTO analytics_cache (key, signature, computed_at, payload) VALUES (?, ?, ?, ?)",
+                     (CACHE_KEY, signature, int(time.time()), payload))
+    return True
+
+def load_leaderboard(db_name=DB_NAME):
+    """Reads the cached leaderboard tables without touching the games or the network. Returns (tables, computed_at) or (None, None)."""
+    row = reader(db_name).execute("SELECT payload, computed_at FROM analytics_cache WHERE key = ?", (CACHE_KEY,)).fetchone()
+    if not row: return None, None
+    tables = {name: pd.read_json(io.StringIO(table), orient="split") for name, table in json.loads(row[0]).items()}
+    tables["players"]["last_game"] = pd.to_datetime(tables["players"]["last_game"])
+    return tables, row[1]
+
+if __name__ == "__main__":
+    from openings import OpeningBook
+    from rating_timeline import tracked_players
+    recomputed = refresh_leaderboard([(name, username) for _, name, username in tracked_players()], OpeningBook(), force=True)
+    print("Leaderboard recomputed." if recomputed else "Leaderboard is up to date.")
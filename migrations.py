@@ -0,0 +1,342 @@
+from datetime import datetime, timezone
+from rating_rollup import rebuild_daily
+
+# --- TIMESTAMP PARSING ---
+# Formats seen in rating_history: the updaters' "%Y-%m-%d %H:%M:%S" and the Google Sheets export.
+TIMESTAMP_FORMATS = ["%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d", "%m/%d/%Y %H:%M:%S", "%m/%d/%Y"]
+
+def to_epoch(timestamp):
+    """Converts a stored timestamp string (treated as UTC) to integer epoch seconds, or None if unparseable."""
+    if timestamp is None: return None
+    if isinstance(timestamp, (int, float)): return int(timestamp)
+    for fmt in TIMESTAMP_FORMATS:
+        try: return int(datetime.strptime(str(timestamp).strip(), fmt).replace(tzinfo=timezone.utc).timestamp())
+        except ValueError: continue
+    return None
+
+# --- MIGRATIONS ---
+def baseline(conn):
+    """The original schema created by database_setup.py and game_store.py."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS current_ratings (
+            friend_name TEXT PRIMARY KEY,
+            rapid_rating INTEGER,
+            rapid_wld TEXT,
+            rapid_change INTEGER,
+            blitz_rating INTEGER,
+            blitz_wld TEXT,
+            blitz_change INTEGER,
+            bullet_rating INTEGER,
+            bullet_wld TEXT,
+            bullet_change INTEGER
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS rating_history (
+            timestamp TEXT,
+            player_name TEXT,
+            category TEXT,
+            rating INTEGER
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS games (
+            url TEXT PRIMARY KEY,
+            uuid TEXT,
+            end_time INTEGER,
+            time_class TEXT,
+            time_control TEXT,
+            rules TEXT,
+            rated INTEGER,
+            white_username TEXT,
+            white_rating INTEGER,
+            white_result TEXT,
+            white_accuracy REAL,
+            black_username TEXT,
+            black_rating INTEGER,
+            black_result TEXT,
+            black_accuracy REAL,
+            eco_url TEXT,
+            pgn TEXT
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_games_white ON games (white_username, end_time)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_games_black ON games (black_username, end_time)")
+    # One row per player per monthly archive. A month is "closed" once it has been fetched after it ended.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS archive_months (
+            username TEXT,
+            month TEXT,
+            url TEXT,
+            closed INTEGER DEFAULT 0,
+            etag TEXT,
+            last_modified TEXT,
+            fetched_at INTEGER,
+            PRIMARY KEY (username, month)
+        )
+    ''')
+
+def normalize_rating_history(conn):
+    """Moves rating snapshots into an indexed, deduplicated table with integer timestamps.
+
+    `rating_points` is clustered on (player_id, category, ts), which is both the
+    lookup index and the uniqueness constraint. `rating_history` becomes a view
+    with the old columns, and an INSTEAD OF trigger keeps legacy inserts working.
+    The trigger aborts an insert whose time cannot be worked out (no `ts`, and a
+    timestamp strftime cannot parse, e.g. the Sheets formats) instead of dropping it.
+    """
+    conn.execute('''
+        CREATE TABLE players (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            chesscom_username TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE rating_points (
+            player_id INTEGER NOT NULL REFERENCES players (id),
+            category TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            rating INTEGER NOT NULL,
+            PRIMARY KEY (player_id, category, ts)
+        ) WITHOUT ROWID
+    ''')
+    rows = conn.execute("SELECT timestamp, player_name, category, rating FROM rating_history").fetchall()
+    conn.executemany("INSERT OR IGNORE INTO players (name) VALUES (?)", {(row[1],) for row in rows if row[1]})
+    player_ids = dict(conn.execute("SELECT name, id FROM players"))
+    points = [(player_ids[name], category, to_epoch(timestamp), rating) for timestamp, name, category, rating in rows
+              if name and category and rating is not None and to_epoch(timestamp) is not None]
+    conn.executemany("INSERT OR IGNORE INTO rating_points (player_id, category, ts, rating) VALUES (?, ?, ?, ?)", points)
+    skipped = len(rows) - len(points)
+    if skipped: print(f"Migration: skipped {skipped} rating_history rows with missing or unparseable values.")
+
+    conn.execute("DROP TABLE rating_history")
+    conn.execute('''
+        CREATE VIEW rating_history AS
+        SELECT datetime(r.ts, 'unixepoch') AS timestamp, p.name AS player_name, r.category, r.rating, r.ts
+        FROM rating_points r JOIN players p ON p.id = r.player_id
+    ''')
+    conn.execute('''
+        CREATE TRIGGER rating_history_insert INSTEAD OF INSERT ON rating_history
+        BEGIN
+            SELECT RAISE(ABORT, 'rating_history insert without ts and with an unparseable timestamp')
+            WHERE COALESCE(NEW.ts, strftime('%s', NEW.timestamp)) IS NULL;
+            INSERT OR IGNORE INTO players (name) VALUES (NEW.player_name);
+            INSERT OR IGNORE INTO rating_points (player_id, category, ts, rating)
+            SELECT id, NEW.category, COALESCE(NEW.ts, CAST(strftime('%s', NEW.timestamp) AS INTEGER)), NEW.rating
+            FROM players WHERE name = NEW.player_name;
+        END
+    ''')
+
+def index_rating_timestamps(conn):
+    """Lets date-range filters and MIN/MAX(ts) across all players use an index."""
+    conn.execute("CREATE INDEX idx_rating_points_ts ON rating_points (ts)")
+
+def daily_rating_rollup(conn):
+    """Adds the per-day rollup the charts read from, seeded from the existing rating points.
+
+    Games played cannot be recovered for past snapshots, so seeded days start at 0.
+    """
+    conn.execute('''
+        CREATE TABLE rating_daily (
+            player_id INTEGER NOT NULL REFERENCES players (id),
+            category TEXT NOT NULL,
+            day TEXT NOT NULL,
+            open_rating INTEGER NOT NULL,
+            close_rating INTEGER NOT NULL,
+            min_rating INTEGER NOT NULL,
+            max_rating INTEGER NOT NULL,
+            open_ts INTEGER NOT NULL,
+            close_ts INTEGER NOT NULL,
+            games_played INTEGER NOT NULL DEFAULT 0,
+            record_total INTEGER,
+            PRIMARY KEY (player_id, category, day)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX idx_rating_daily_day ON rating_daily (day)")
+    rebuild_daily(conn)
+
+def updater_schedule(conn):
+    """State for the resident updater: when each player is next due, and a log of update runs."""
+    conn.execute('''
+        CREATE TABLE player_schedule (
+            player_id INTEGER PRIMARY KEY REFERENCES players (id),
+            next_due INTEGER NOT NULL,
+            interval_seconds INTEGER NOT NULL,
+            last_checked INTEGER,
+            last_played INTEGER,
+            consecutive_errors INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE updater_runs (
+            id INTEGER PRIMARY KEY,
+            started_at INTEGER NOT NULL,
+            finished_at INTEGER NOT NULL,
+            mode TEXT NOT NULL,
+            players_checked INTEGER NOT NULL,
+            players_changed INTEGER NOT NULL,
+            errors INTEGER NOT NULL
+        )
+    ''')
+
+def analytics_cache(conn):
+    """Precomputed analytics (e.g. the leaderboard) keyed by name, with the input signature they were computed from."""
+    conn.execute('''
+        CREATE TABLE analytics_cache (
+            key TEXT PRIMARY KEY,
+            signature TEXT NOT NULL,
+            computed_at INTEGER NOT NULL,
+            payload TEXT NOT NULL
+        )
+    ''')
+
+def engine_analysis(conn):
+    """Results of the batch engine analysis: one summary row per game per colour, and each ply's evaluation and loss.
+
+    Evaluations are White-relative centipawns with mates mapped to a large score;
+    `cp_loss` is the loss for the side that moved.
+    """
+    conn.execute('''
+        CREATE TABLE game_analysis (
+            url TEXT NOT NULL,
+            color TEXT NOT NULL,
+            analyzed_at INTEGER NOT NULL,
+            depth INTEGER,
+            nodes INTEGER,
+            moves INTEGER NOT NULL,
+            accuracy REAL,
+            avg_cp_loss REAL,
+            excellent INTEGER NOT NULL,
+            good INTEGER NOT NULL,
+            inaccuracies INTEGER NOT NULL,
+            mistakes INTEGER NOT NULL,
+            blunders INTEGER NOT NULL,
+            PRIMARY KEY (url, color)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE analysis_moves (
+            url TEXT NOT NULL,
+            ply INTEGER NOT NULL,
+            eval_before INTEGER NOT NULL,
+            eval_after INTEGER NOT NULL,
+            cp_loss INTEGER NOT NULL,
+            quality TEXT NOT NULL,
+            PRIMARY KEY (url, ply)
+        ) WITHOUT ROWID
+    ''')
+
+def packed_analysis(conn):
+    """Replaces the row-per-ply analysis_moves table with one packed_analysis.PackedAnalysis blob per game.
+
+    The old rows lack the engine's top moves, so their games are queued for
+    the batch job again; their positions are answered from the evaluation cache.
+    """
+    conn.execute('''
+        CREATE TABLE analysis_data (
+            url TEXT PRIMARY KEY,
+            data BLOB NOT NULL
+        )
+    ''')
+    conn.execute("DROP TABLE analysis_moves")
+    conn.execute("DELETE FROM game_analysis")
+
+def archive_games(conn):
+    """Moves the game archives out of the committed database into the attached `archive` sidecar.
+
+    They are raw Chess.com data (PGN included) that can always be downloaded
+    again; the ratings database keeps only what is derived from them.
+    """
+    create_archive(conn)
+    for table in ("games", "archive_months"):
+        conn.execute(f"INSERT OR IGNORE INTO archive.{table} SELECT * FROM main.{table}")
+        conn.execute(f"DROP TABLE main.{table}")
+
+# Append-only: each entry runs once, in order, and bumps PRAGMA user_version.
+MIGRATIONS = [
+    (1, baseline),
+    (2, normalize_rating_history),
+    (3, index_rating_timestamps),
+    (4, daily_rating_rollup),
+    (5, updater_schedule),
+    (6, analytics_cache),
+    (7, engine_analysis),
+    (8, packed_analysis),
+    (9, archive_games),
+]
+
+# --- GAMES ARCHIVE ---
+def create_archive(conn):
+    """Creates the game archive tables in the attached `archive` database if they do not exist yet.
+
+    The sidecar is not committed, so it can be missing on a machine whose
+    ratings database is already migrated; it is then created empty and refilled
+    by the archive sync.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS archive.games (
+            url TEXT PRIMARY KEY,
+            uuid TEXT,
+            end_time INTEGER,
+            time_class TEXT,
+            time_control TEXT,
+            rules TEXT,
+            rated INTEGER,
+            white_username TEXT,
+            white_rating INTEGER,
+            white_result TEXT,
+            white_accuracy REAL,
+            black_username TEXT,
+            black_rating INTEGER,
+            black_result TEXT,
+            black_accuracy REAL,
+            eco_url TEXT,
+            pgn TEXT
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_games_white ON games (white_username, end_time)")
+    conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_games_black ON games (black_username, end_time)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS archive.archive_months (
+            username TEXT,
+            month TEXT,
+            url TEXT,
+            closed INTEGER DEFAULT 0,
+            etag TEXT,
+            last_modified TEXT,
+            fetched_at INTEGER,
+            PRIMARY KEY (username, month)
+        )
+    ''')
+
+# --- RUNNER ---
+def migrate(conn):
+    """Applies every pending migration, each in its own transaction. Returns the resulting schema version."""
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+    isolation_level, conn.isolation_level = conn.isolation_level, None
+    try:
+        for version, step in MIGRATIONS:
+            if version <= current: continue
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Re-check inside the write lock in case another process migrated first.
+                if conn.execute("PRAGMA user_version").fetchone()[0] >= version:
+                    conn.execute("ROLLBACK"); continue
+                step(conn)
+                conn.execute(f"PRAGMA user_version = {version}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            current = version
+    finally:
+        conn.isolation_level = isolation_level
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+if __name__ == "__main__":
+    # db.connect attaches the games archive, which the migrations expect.
+    from db import connect
+    conn = connect("chess_ratings.db", migrate_schema=False)
+    try: print(f"Database schema is at version {migrate(conn)}.")
+    finally: conn.close()
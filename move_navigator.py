@@ -0,0 +1,223 @@
+import json
+import chess
+import chess.svg
+from packed_analysis import decode_move
+
+# --- CONFIGURATION ---
+# Matches create_eval_bar: ±10 pawns fills the bar, and a forced mate counts as that.
+EVAL_BAR_LIMIT_CP = 1000
+BOARD_SIZE = 400
+NAVIGATOR_HEIGHT = 520
+# The browser draws the board from FENs with python-chess's own piece artwork, so each
+# position costs a few dozen bytes instead of a ~30 KB SVG.
+PIECE_DEFS = "<defs>" + "".join(chess.svg.PIECES.values()) + "</defs>"
+PIECE_IDS = {symbol: f"{'white' if symbol.isupper() else 'black'}-{chess.piece_name(chess.Piece.from_symbol(symbol).piece_type)}"
+             for symbol in chess.svg.PIECES}
+
+# --- DATA ---
+def _score(evaluation):
+    """(eval bar value in centipawns, label) for an evaluation."""
+    if evaluation["type"] == "mate":
+        mate = evaluation["value"]
+        return (EVAL_BAR_LIMIT_CP if mate > 0 else -EVAL_BAR_LIMIT_CP), (f"M{abs(mate)}" if mate else "#")
+    return max(-EVAL_BAR_LIMIT_CP, min(EVAL_BAR_LIMIT_CP, evaluation["value"])), f"{evaluation['value'] / 100.0:.2f}"
+
+def _lines(board, top_moves):
+    """The engine's top choices at `board` as [SAN, eval label] pairs."""
+    lines = []
+    for line in top_moves:
+        if line.get("Centipawn") is not None: label = f"{line['Centipawn'] / 100.0:.2f}"
+        elif line.get("Mate") is not None: label = f"M{line['Mate']}"
+        else: label = "N/A"
+        lines.append([board.san(chess.Move.from_uci(line["Move"])), label])
+    return lines
+
+def navigator_data(analysis):
+    """Everything the navigator shows for the analysed positions of a PackedAnalysis, from a single replay.
+
+    One entry per position: the board placement, eval bar value and label, the
+    engine's best move as an arrow, and (after the start) the move that led there
+    with its quality, comment and the engine's top choices before it.
+    """
+    positions, lines = [], []
+    board = chess.Board(analysis.start_fen)
+    for p, move_data in enumerate([None, *analysis]):
+        top_moves = analysis.top_moves_at(p) if p < len(analysis) else []
+        best = chess.Move.from_uci(top_moves[0]["Move"]) if top_moves else None
+        value, label = _score(analysis.evaluation(p)) if p < len(analysis.scores) else (0, "")
+        entry = {"board": board.board_fen(), "eval": value, "label": label, "arrow": [best.from_square, best.to_square] if best else None}
+        if move_data is not None:
+            entry["move"] = {key: move_data[key] for key in ("move_number", "color", "move", "move_quality", "comment")}
+            entry["move"]["lines"] = lines
+        positions.append(entry)
+        if p < len(analysis):
+            lines = _lines(board, top_moves)
+            board.push(decode_move(analysis.moves[p]))
+    return positions
+
+# --- COMPONENT ---
+def navigator_html(analysis, key, arrow_color="#6B17CC", orientation=chess.WHITE, size=BOARD_SIZE):
+    """A self-contained HTML page (for streamlit.components.v1.html) that steps through an analysed game in the browser.
+
+    Previous/Next, the first/last buttons and (while the navigator has focus) the
+    arrow and Home/End keys only redraw the page; nothing is sent back to the
+    server. The current position (and whether the navigator had keyboard focus)
+    is kept in the browser's sessionStorage under `key`, so it survives the
+    reruns that publish new plies while the analysis is still running.
+    """
+    data = {
+        "key": f"navigator:{key}", "positions": navigator_data(analysis), "pieces": PIECE_IDS, "arrowColor": arrow_color,
+        "flipped": orientation == chess.BLACK, "size": size,
+        "light": chess.svg.DEFAULT_COLORS["square light"], "dark": chess.svg.DEFAULT_COLORS["square dark"],
+    }
+    # "</" is escaped so no string in the data can close the script element.
+    return NAVIGATOR_TEMPLATE.replace("__PIECE_DEFS__", PIECE_DEFS).replace("__DATA__", json.dumps(data).replace("</", "<\\/"))
+
+NAVIGATOR_TEMPLATE = """
+<style>
+  body { margin: 0; font-family: "Source Sans Pro", sans-serif; color: #31333F; }
+  .nav { display: flex; gap: 24px; align-items: flex-start; outline: none; }
+  .board-col { flex: 0 0 auto; }
+  .panel { flex: 1 1 auto; min-width: 0; }
+  .bar { position: relative; background: #333; border: 1px solid #555; height: 25px; border-radius: 5px; overflow: hidden; margin-top: 8px; }
+  .bar-fill { background: white; height: 100%; }
+  .bar-text { position: absolute; top: 0; left: 0; width: 100%; height: 100%; text-align: center; line-height: 25px; font-size: 0.9em; }
+  .controls { display: flex; gap: 6px; margin-top: 8px; }
+  .controls button { flex: 1; padding: 6px 0; border: 1px solid rgba(49, 51, 63, 0.2); border-radius: 8px; background: white; cursor: pointer; font-size: 1em; }
+  .controls button:disabled { opacity: 0.4; cursor: default; }
+  .hint { font-size: 0.8em; color: #808495; margin-top: 6px; }
+  .quality { padding: 12px 16px; border-radius: 8px; margin: 8px 0 16px; }
+  .Excellent { background: rgba(33, 195, 84, 0.1); color: #177233; }
+  .Good, .Book { background: rgba(28, 131, 225, 0.1); color: #004280; }
+  .Inaccuracy { background: rgba(255, 193, 7, 0.15); color: #926c05; }
+  .Mistake, .Blunder { background: rgba(255, 43, 43, 0.09); color: #7d353b; }
+  h3 { margin: 0 0 8px; } h4 { margin: 0 0 8px; font-weight: 400; }
+  ol { padding-left: 20px; } code { background: #f0f2f6; padding: 1px 4px; border-radius: 4px; }
+</style>
+<div class="nav" id="nav" tabindex="0">
+  <div class="board-col">
+    <svg id="board" xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" viewBox="0 0 360 360">__PIECE_DEFS__<g id="squares"></g><g id="pieces"></g><g id="arrows"></g></svg>
+    <div class="bar"><div class="bar-fill" id="bar-fill"></div><div class="bar-text" id="bar-text"></div></div>
+    <div class="controls">
+      <button id="first" title="Start (Home)">⏮</button><button id="prev" title="Previous (←)">⬅️ Previous</button>
+      <button id="next" title="Next (→)">Next ➡️</button><button id="last" title="End (End)">⏭</button>
+    </div>
+    <div class="hint">Click the board, then use ← → to step and Home / End to jump.</div>
+  </div>
+  <div class="panel" id="panel"></div>
+</div>
+<script>
+const data = __DATA__;
+const SQ = 45, positions = data.positions, last = positions.length - 1;
+const board = document.getElementById("board");
+board.setAttribute("width", data.size); board.setAttribute("height", data.size);
+let ply = Math.min(parseInt(sessionStorage.getItem(data.key) || "0", 10) || 0, last);
+
+function el(tag, attrs, text) {
+  const ns = ["rect", "use", "line", "polygon", "g"].includes(tag) ? "http://www.w3.org/2000/svg" : null;
+  const node = ns ? document.createElementNS(ns, tag) : document.createElement(tag);
+  for (const [name, value] of Object.entries(attrs || {})) node.setAttribute(name, value);
+  if (text !== undefined) node.textContent = text;
+  return node;
+}
+function corner(square) {
+  const file = square % 8, rank = Math.floor(square / 8);
+  return data.flipped ? [(7 - file) * SQ, rank * SQ] : [file * SQ, (7 - rank) * SQ];
+}
+function drawSquares() {
+  const group = document.getElementById("squares");
+  for (let square = 0; square < 64; square++) {
+    const [x, y] = corner(square), light = (square % 8 + Math.floor(square / 8)) % 2 === 1;
+    group.appendChild(el("rect", {x: x, y: y, width: SQ, height: SQ, fill: light ? data.light : data.dark}));
+  }
+}
+function drawPieces(placement) {
+  const group = document.getElementById("pieces");
+  group.replaceChildren();
+  placement.split("/").forEach((row, i) => {
+    let file = 0;
+    for (const symbol of row) {
+      if (/[1-8]/.test(symbol)) { file += parseInt(symbol, 10); continue; }
+      const [x, y] = corner((7 - i) * 8 + file);
+      group.appendChild(el("use", {href: "#" + data.pieces[symbol], "xlink:href": "#" + data.pieces[symbol], transform: `translate(${x}, ${y})`}));
+      file++;
+    }
+  });
+}
+function drawArrow(arrow) {
+  // Same geometry as chess.svg.board's arrows.
+  const group = document.getElementById("arrows");
+  group.replaceChildren();
+  if (!arrow) return;
+  const [tx, ty] = corner(arrow[0]).map(v => v + SQ / 2), [hx, hy] = corner(arrow[1]).map(v => v + SQ / 2);
+  const size = 0.75 * SQ, margin = 0.1 * SQ, dx = hx - tx, dy = hy - ty, hypot = Math.hypot(dx, dy);
+  const sx = hx - dx * (size + margin) / hypot, sy = hy - dy * (size + margin) / hypot;
+  const tipx = hx - dx * margin / hypot, tipy = hy - dy * margin / hypot;
+  group.appendChild(el("line", {x1: tx, y1: ty, x2: sx, y2: sy, stroke: data.arrowColor, "stroke-width": SQ * 0.2, "stroke-linecap": "butt"}));
+  const points = [[tipx, tipy], [sx + dy * 0.5 * size / hypot, sy - dx * 0.5 * size / hypot], [sx - dy * 0.5 * size / hypot, sy + dx * 0.5 * size / hypot]];
+  group.appendChild(el("polygon", {points: points.map(p => p.join(",")).join(" "), fill: data.arrowColor}));
+}
+function drawPanel(position) {
+  const panel = document.getElementById("panel");
+  panel.replaceChildren();
+  const move = position.move;
+  if (!move) {
+    panel.appendChild(el("h3", {}, "Starting Position"));
+    panel.appendChild(el("div", {class: "quality Good"}, "Use the navigation buttons or the arrow keys to step through the game."));
+    return;
+  }
+  panel.appendChild(el("h3", {}, `Move ${move.move_number}: ${move.color}`));
+  const played = el("h4", {}, "You played "); played.appendChild(el("b", {}, move.move)); panel.appendChild(played);
+  const box = el("div", {class: "quality " + move.move_quality});
+  box.appendChild(el("b", {}, move.move_quality + (["Excellent", "Mistake", "Blunder"].includes(move.move_quality) ? "! " : ". ")));
+  box.appendChild(document.createTextNode(move.comment));
+  panel.appendChild(box);
+  if (move.lines.length) {
+    panel.appendChild(el("h3", {}, "Engine's Top Choices"));
+    const list = el("ol");
+    for (const [san, label] of move.lines) {
+      const item = el("li"); item.appendChild(el("code", {}, san)); item.appendChild(document.createTextNode(` (Eval: ${label})`));
+      list.appendChild(item);
+    }
+    panel.appendChild(list);
+  }
+}
+function show(target) {
+  ply = Math.max(0, Math.min(last, target));
+  sessionStorage.setItem(data.key, ply);
+  const position = positions[ply];
+  drawPieces(position.board);
+  drawArrow(position.arrow);
+  const percentage = 50 + position.eval / 20;
+  document.getElementById("bar-fill").style.width = percentage + "%";
+  const text = document.getElementById("bar-text");
+  text.textContent = position.label ? "Eval: " + position.label : "";
+  text.style.color = percentage > 40 && percentage < 60 ? "black" : "white";
+  drawPanel(position);
+  document.getElementById("first").disabled = document.getElementById("prev").disabled = ply === 0;
+  document.getElementById("next").disabled = document.getElementById("last").disabled = ply === last;
+}
+function onKey(event) {
+  const step = {ArrowLeft: ply - 1, ArrowRight: ply + 1, Home: 0, End: last}[event.key];
+  if (step === undefined) return;
+  event.preventDefault();
+  show(step);
+}
+document.getElementById("first").onclick = () => show(0);
+document.getElementById("prev").onclick = () => show(ply - 1);
+document.getElementById("next").onclick = () => show(ply + 1);
+document.getElementById("last").onclick = () => show(last);
+// Keys are only handled while focus is inside the navigator, so the rest of the app keeps its own keyboard behaviour.
+const nav = document.getElementById("nav");
+nav.addEventListener("keydown", onKey);
+board.addEventListener("mousedown", () => nav.focus());
+// A newly published ply rebuilds the frame, which drops keyboard focus. The navigator remembers
+// that it had focus and takes it back; leaving it (the timeout never runs in a discarded frame) forgets.
+const focusKey = data.key + ":focus";
+nav.addEventListener("focusin", () => sessionStorage.setItem(focusKey, "1"));
+window.addEventListener("blur", () => setTimeout(() => sessionStorage.removeItem(focusKey), 0));
+if (sessionStorage.getItem(focusKey)) nav.focus({preventScroll: true});
+drawSquares();
+show(ply);
+</script>
+"""
@@ -0,0 +1,119 @@
+import os
+import re
+import sqlite3
+import threading
+
+# --- CONFIGURATION ---
+# Compiled from the Lichess/chess-openings dataset by build_openings.py (run by the
+# "Build Opening Table" workflow, which commits the file) and shipped with the app. Until it
+# is committed, the dashboards build it on their first load.
+OPENINGS_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "openings.db")
+MMAP_SIZE = 8 * 1024 * 1024
+
+# --- PGN TOKENIZING ---
+# Comments ({[%clk ...]}), variations, NAGs, move numbers and results are not moves.
+_NON_MOVE_TEXT = re.compile(r"\{[^}]*\}|\([^()]*\)|\$\d+|;[^\n]*")
+_MOVE_NUMBER = re.compile(r"^\d+\.+")
+_RESULTS = {"1-0", "0-1", "1/2-1/2", "*"}
+
+def san_tokens(movetext):
+    """Splits PGN movetext into bare SAN moves without needing to replay them on a board."""
+    for token in _NON_MOVE_TEXT.sub(" ", movetext).split():
+        token = _MOVE_NUMBER.sub("", token)
+        if token and token not in _RESULTS: yield token.rstrip("!?")
+
+def movetext(pgn_text):
+    """Returns the part of a PGN after its header section."""
+    body = [line for line in pgn_text.splitlines() if not line.startswith("[")]
+    return " ".join(body)
+
+
+class OpeningIndex:
+    """A move trie over the opening book that finds the deepest named line a game follows.
+
+    Each node is a dict of SAN move -> child node; a node's opening name (if any)
+    is stored under the None key. Classification walks one node per move and stops
+    at the first move that leaves the book, so it costs O(book depth) per game.
+    """
+
+    def __init__(self):
+        self._root = {}
+        self.size = 0
+
+    @classmethod
+    def from_pgn_map(cls, pgn_map):
+        """Builds the index from the dataset's {"1. e4 e5 2. Nf3": name} mapping."""
+        index = cls()
+        for pgn, name in (pgn_map or {}).items(): index.add(san_tokens(pgn), name)
+        return index
+
+    def add(self, moves, name):
+        node = self._root
+        for san in moves: node = node.setdefault(san, {})
+        node[None] = name
+        self.size += 1
+
+    def classify(self, moves):
+        """Returns the name of the deepest book line matching a sequence of SAN moves, or None."""
+        node, name = self._root, None
+        for san in moves:
+            node = node.get(san)
+            if node is None: break
+            name = node.get(None, name)
+        return name
+
+    def book_plies(self, moves):
+        """How many leading SAN moves stay inside the book (on a path to some named line)."""
+        node, plies = self._root, 0
+        for san in moves:
+            node = node.get(san)
+            if node is None: break
+            plies += 1
+        return plies
+
+    def classify_pgn(self, pgn_text):
+        """Classifies a full PGN (headers and all) straight from its movetext."""
+        return self.classify(san_tokens(movetext(pgn_text))) if pgn_text else None
+
+
+class OpeningBook:
+    """The precompiled opening table, read from disk only the first time it is needed."""
+
+    def __init__(self, path=OPENINGS_DB):
+        self.path = path
+        self._eco_map, self._pgn_map, self._index = None, None, None
+        self._lock = threading.Lock()
+
+    @property
+    def available(self):
+        return os.path.exists(self.path)
+
+    def _load(self):
+        with self._lock:
+            if self._index is not None: return
+            # One read-only scan of a ~100 KB table (memory-mapped, so no read() per page); the rows
+            # are then copied into the dicts and trie below, which serve every later lookup.
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            try:
+                conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+                rows = conn.execute("SELECT eco, name, pgn FROM openings ORDER BY id").fetchall()
+            finally:
+                conn.close()
+            self._eco_map = {eco: name for eco, name, _ in rows}
+            self._pgn_map = {pgn: name for _, name, pgn in rows}
+            self._index = OpeningIndex.from_pgn_map(self._pgn_map)
+
+    @property
+    def eco_map(self):
+        self._load()
+        return self._eco_map
+
+    @property
+    def pgn_map(self):
+        self._load()
+        return self._pgn_map
+
+    @property
+    def index(self):
+        self._load()
+        return self._index
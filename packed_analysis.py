@@ -0,0 +1,242 @@
+import sys
+import struct
+from array import array
+from functools import lru_cache
+import chess
+from game_analysis import TOP_MOVES, classify_move, generate_move_comment
+
+# --- CONFIGURATION ---
+FORMAT_MAGIC = b"PKA1"
+# magic, top moves per position, plies, positions analysed, starting FEN length.
+HEADER = struct.Struct("<4sBHHH")
+# Scores are White-relative centipawns in an int16 (positive favours White). A mate in N is
+# stored as ±(MATE_SCORE - N), positive when White mates.
+MATE_SCORE = 32000
+MATE_THRESHOLD = 30000
+MAX_CP = MATE_THRESHOLD - 1
+# Codes are stored, so new qualities are only ever appended.
+QUALITIES = ("Excellent", "Good", "Inaccuracy", "Mistake", "Blunder", "Book")
+BOOK = QUALITIES.index("Book")
+# Move code 0 would be a1a1, which is never legal, so it marks an empty top-move slot.
+NO_MOVE = 0
+# Games whose FEN lists are kept for navigation.
+FEN_CACHE_GAMES = 64
+
+# --- ENCODING ---
+def encode_move(move):
+    """Packs a move into 15 bits: from square, to square and promotion piece type."""
+    return move.from_square | move.to_square << 6 | (move.promotion or 0) << 12
+
+def decode_move(code):
+    return chess.Move(code & 63, code >> 6 & 63, code >> 12 or None)
+
+def encode_score(kind, value, white_to_move=True):
+    """Packs a White-relative centipawn or mate score.
+
+    A mate in 0 has no sign of its own (the side to move is mated), so it takes one from `white_to_move`.
+    """
+    if kind == "cp": return max(-MAX_CP, min(MAX_CP, value))
+    if value == 0: return -MATE_SCORE if white_to_move else MATE_SCORE
+    return MATE_SCORE - value if value > 0 else -MATE_SCORE - value
+
+def decode_score(score):
+    """The {"type", "value"} evaluation dict for a packed score."""
+    if abs(score) < MATE_THRESHOLD: return {"type": "cp", "value": score}
+    return {"type": "mate", "value": MATE_SCORE - score if score > 0 else -MATE_SCORE - score}
+
+def _little_endian(values):
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+def _read_array(typecode, data, offset, count):
+    values = array(typecode)
+    values.frombytes(data[offset:offset + count * values.itemsize])
+    if sys.byteorder == "big": values.byteswap()
+    return values, offset + count * values.itemsize
+
+@lru_cache(maxsize=FEN_CACHE_GAMES)
+def _replay_fens(start_fen, move_codes):
+    board, moves = chess.Board(start_fen), array("H")
+    moves.frombytes(move_codes)
+    fens = [board.fen()]
+    for code in moves:
+        board.push(decode_move(code))
+        fens.append(board.fen())
+    return tuple(fens)
+
+
+class PackedAnalysis:
+    """A game's engine analysis in flat arrays: about 20 bytes per ply instead of a dict per ply and per top move.
+
+    Holds the starting FEN, the played moves, one int16 score per position, the
+    engine's top moves and their scores, and a quality code per ply. Opening book
+    positions are not searched: they score 0 with no top moves, and the moves
+    played from them are "Book". Positions
+    are appended as their search results arrive; a ply is readable once the
+    position after it is in, and the scores array is extended last so readers on
+    other threads never see a half-added position. SAN, comments and FENs are
+    rebuilt on demand by replaying the moves.
+
+    `analysis[i]` and iteration give the same move_data dicts as
+    game_analysis.build_move_data.
+    """
+
+    def __init__(self, start_fen, moves, top_n=TOP_MOVES):
+        self.start_fen, self.top_n = start_fen, top_n
+        self.moves = array("H", (encode_move(move) for move in moves))
+        self.scores = array("h")
+        self.top_moves = array("H")
+        self.top_scores = array("h")
+        self.qualities = array("B")
+        self.book_positions = 0
+        self._white_first = chess.Board(start_fen).turn == chess.WHITE
+
+    @classmethod
+    def from_results(cls, start_fen, moves, results, top_n=TOP_MOVES):
+        """Builds a complete analysis from (result, engine_calls) pairs in position order. Returns (analysis, engine_calls)."""
+        analysis, engine_calls = cls(start_fen, moves, top_n), 0
+        for result, calls in results:
+            analysis.add_position(result)
+            engine_calls += calls
+        return analysis, engine_calls
+
+    # --- BUILDING ---
+    def add_position(self, result):
+        """Appends the next position's evaluate_position result, or None for an unsearched book position.
+
+        The result's scores must be White-relative, as the pool and worker engines report them.
+        """
+        i = len(self.scores)
+        if result is None:
+            if i != self.book_positions: raise ValueError("Book positions must come before every searched position.")
+            self.book_positions += 1
+            result = {"evaluation": {"type": "cp", "value": 0}, "top_moves": []}
+        white_to_move = self.white_to_move(i)
+        evaluation = result["evaluation"]
+        score = encode_score(evaluation["type"], evaluation["value"], white_to_move)
+        top = result["top_moves"][:self.top_n]
+        for line in top:
+            mate = line.get("Mate")
+            self.top_moves.append(encode_move(chess.Move.from_uci(line["Move"])))
+            self.top_scores.append(encode_score("mate", mate) if mate is not None else encode_score("cp", line.get("Centipawn") or 0))
+        self.top_moves.extend([NO_MOVE] * (self.top_n - len(top)))
+        self.top_scores.extend([0] * (self.top_n - len(top)))
+        if i > 0:
+            book = i - 1 < self.book_positions
+            self.qualities.append(BOOK if book else QUALITIES.index(classify_move(self._cp_loss(i - 1, self.scores[i - 1], score))))
+        self.scores.append(score)
+
+    # --- READING ---
+    def __len__(self):
+        """Plies whose analysis is complete."""
+        return max(0, len(self.scores) - 1)
+
+    @property
+    def total_plies(self):
+        return len(self.moves)
+
+    @property
+    def done(self):
+        return len(self) == self.total_plies
+
+    def white_to_move(self, position):
+        return self._white_first == (position % 2 == 0)
+
+    def evaluation(self, position):
+        return decode_score(self.scores[position])
+
+    def _cp_loss(self, ply_index, before, after):
+        """Centipawns lost by the side that moved; 0 when either side of the move is a mate score."""
+        if abs(before) >= MATE_THRESHOLD or abs(after) >= MATE_THRESHOLD: return 0
+        return before - after if self.white_to_move(ply_index) else after - before
+
+    def cp_loss(self, ply_index):
+        if self.qualities[ply_index] == BOOK: return 0
+        return self._cp_loss(ply_index, self.scores[ply_index], self.scores[ply_index + 1])
+
+    def quality(self, ply_index):
+        return QUALITIES[self.qualities[ply_index]]
+
+    def top_moves_at(self, position):
+        """The engine's top moves at a position in the stockfish wrapper's {"Move", "Centipawn", "Mate"} shape."""
+        lines = []
+        for j in range(position * self.top_n, (position + 1) * self.top_n):
+            if self.top_moves[j] == NO_MOVE: break
+            evaluation = decode_score(self.top_scores[j])
+            lines.append({"Move": decode_move(self.top_moves[j]).uci(),
+                          "Centipawn": evaluation["value"] if evaluation["type"] == "cp" else None,
+                          "Mate": evaluation["value"] if evaluation["type"] == "mate" else None})
+        return lines
+
+    def board(self, position):
+        """The board at a position (0 is the start), replayed from the move list."""
+        board = chess.Board(self.start_fen)
+        for code in self.moves[:position]: board.push(decode_move(code))
+        return board
+
+    def fen(self, position):
+        return self.fens()[position]
+
+    def fens(self):
+        """Every position's FEN, start included. Replayed once per game and shared by snapshots of it."""
+        return _replay_fens(self.start_fen, self.moves.tobytes())
+
+    def _move_data(self, i, board):
+        """The move_data dict for ply i + 1; `board` is the position before it."""
+        move, top_moves = decode_move(self.moves[i]), self.top_moves_at(i)
+        move_data = {
+            'ply': i + 1, 'move_number': i // 2 + 1, 'color': "White" if board.turn == chess.WHITE else "Black",
+            'move': board.san(move), 'best_move': board.san(chess.Move.from_uci(top_moves[0]['Move'])) if top_moves else "N/A",
+            'eval_before': self.evaluation(i)['value'], 'eval_after': self.evaluation(i + 1)['value'],
+            'eval_loss': self.cp_loss(i) / 100.0, 'move_quality': self.quality(i), 'top_moves': top_moves
+        }
+        move_data['comment'] = generate_move_comment(move_data)
+        return move_data
+
+    def __getitem__(self, i):
+        if i < 0: i += len(self)
+        if not 0 <= i < len(self): raise IndexError(i)
+        return self._move_data(i, self.board(i))
+
+    def __iter__(self):
+        board = chess.Board(self.start_fen)
+        for i in range(len(self)):
+            move_data = self._move_data(i, board)
+            board.push(decode_move(self.moves[i]))
+            yield move_data
+
+    # --- SERIALIZATION ---
+    def to_bytes(self):
+        """The compact storage format: a fixed header, the starting FEN and the little-endian arrays."""
+        fen, positions = self.start_fen.encode(), len(self.scores)
+        # Sliced to `positions`: a position being added may already have its top moves and quality in place.
+        return b"".join([
+            HEADER.pack(FORMAT_MAGIC, self.top_n, len(self.moves), positions, len(fen)), fen,
+            _little_endian(self.moves), _little_endian(self.scores[:positions]), _little_endian(self.top_moves[:positions * self.top_n]),
+            _little_endian(self.top_scores[:positions * self.top_n]), self.qualities[:max(0, positions - 1)].tobytes(),
+        ])
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, top_n, plies, positions, fen_length = HEADER.unpack_from(data)
+        if magic != FORMAT_MAGIC: raise ValueError("Not a packed analysis.")
+        offset = HEADER.size + fen_length
+        analysis = cls(data[HEADER.size:offset].decode(), [], top_n)
+        analysis.moves, offset = _read_array("H", data, offset, plies)
+        scores, offset = _read_array("h", data, offset, positions)
+        analysis.top_moves, offset = _read_array("H", data, offset, positions * top_n)
+        analysis.top_scores, offset = _read_array("h", data, offset, positions * top_n)
+        analysis.qualities, offset = _read_array("B", data, offset, max(0, positions - 1))
+        analysis.scores = scores
+        analysis.book_positions = next((i for i, code in enumerate(analysis.qualities) if code != BOOK), len(analysis.qualities))
+        return analysis
+
+    def __reduce__(self):
+        # Pickles (Streamlit's cache and session state) in the compact format.
+        return PackedAnalysis.from_bytes, (self.to_bytes(),)
+
+    def snapshot(self):
+        """A copy of the plies analysed so far, safe to read while a job keeps appending to the original."""
+        return PackedAnalysis.from_bytes(self.to_bytes())
@@ -0,0 +1,135 @@
+from datetime import datetime, timezone
+import pandas as pd
+from db import reader
+from game_store import DB_NAME
+
+# --- CONFIGURATION ---
+# Chess.com result codes that end a game drawn. Any other non-"win" code is a loss.
+DRAW_RESULTS = ["agreed", "repetition", "stalemate", "insufficient", "50move", "timevsinsufficient"]
+FRAME_COLUMNS = ["url", "end_time", "time_class", "rated", "player", "color", "result", "outcome", "rating",
+                 "opponent", "opponent_rating", "accuracy", "eco", "pgn"]
+
+# --- FRAME ---
+def roster_frame(usernames, db_name=DB_NAME):
+    """Returns the archived standard-chess games of several players as one columnar row per player per game.
+
+    Each row is seen from `player`'s side of the board; a game between two of the
+    players appears once for each. The white/black branching happens once in SQL
+    (one SELECT per colour over its username index) instead of per game in Python.
+    """
+    usernames = [u.lower() for u in usernames]
+    placeholders = ", ".join("?" * len(usernames))
+    sides = [
+        f'''SELECT url, end_time, time_class, rated, {color}_username AS player, '{color}' AS color, {color}_result AS result,
+                   {color}_rating AS rating, {other}_username AS opponent, {other}_rating AS opponent_rating, {color}_accuracy AS accuracy, pgn
+            FROM archive.games WHERE {color}_username IN ({placeholders}) AND rules = 'chess\''''
+        for color, other in (("white", "black"), ("black", "white"))
+    ]
+    df = pd.read_sql_query(" UNION ALL ".join(sides) + " ORDER BY end_time", reader(db_name), params=usernames * 2)
+    df["end_time"] = pd.to_datetime(df["end_time"], unit="s", utc=True)
+    df["rated"] = df["rated"].astype(bool)
+    df["outcome"] = "loss"
+    df.loc[df["result"].isin(DRAW_RESULTS), "outcome"] = "draw"
+    df.loc[df["result"] == "win", "outcome"] = "win"
+    df["eco"] = df["pgn"].str.extract(r'\[ECO "([^"]+)"\]', expand=False)
+    for column in ("player", "color", "time_class", "outcome"): df[column] = df[column].astype("category")
+    return df[FRAME_COLUMNS]
+
+def games_frame(username, db_name=DB_NAME):
+    """Returns one player's archived standard-chess games, one row per game from their side of the board."""
+    return roster_frame([username], db_name)
+
+def engine_frame(username, db_name=DB_NAME):
+    """The batch engine analysis of a player's games, one row per analysed game from their side of the board."""
+    username = username.lower()
+    return pd.read_sql_query('''
+        SELECT a.url, a.color, a.moves AS analysed_moves, a.accuracy AS engine_accuracy, a.avg_cp_loss,
+               a.inaccuracies, a.mistakes, a.blunders
+        FROM game_analysis a JOIN archive.games g ON g.url = a.url
+        WHERE (a.color = 'white' AND g.white_username = ?) OR (a.color = 'black' AND g.black_username = ?)
+    ''', reader(db_name), params=(username, username))
+
+def add_openings(df, book):
+    """Adds an `opening` column: the book name for the game's ECO code, else the trie match on its moves.
+
+    The ECO lookup is a vectorized map; only games whose code is not in the book
+    fall back to parsing the PGN.
+    """
+    df = df.copy()
+    df["opening"] = df["eco"].map(book.eco_map) if book.available else None
+    if book.available:
+        missing = df["opening"].isna() & df["pgn"].notna()
+        df.loc[missing, "opening"] = df.loc[missing, "pgn"].map(book.index.classify_pgn)
+    return df
+
+def recent_months_start(months, now=None):
+    """The first instant of the month `months - 1` months before the current one (UTC), e.g. the last 4 archive months."""
+    now = now or datetime.now(timezone.utc)
+    month_index = now.year * 12 + now.month - 1 - (months - 1)
+    return datetime(month_index // 12, month_index % 12 + 1, 1, tzinfo=timezone.utc)
+
+# --- AGGREGATES ---
+def _utc(value):
+    ts = pd.Timestamp(value)
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+
+def select_games(df, time_classes=None, start=None, end=None):
+    """Slices the frame by time control and by end date (`start` and `end` are inclusive days)."""
+    mask = pd.Series(True, index=df.index)
+    if time_classes: mask &= df["time_class"].isin(time_classes)
+    if start is not None: mask &= df["end_time"] >= _utc(start)
+    if end is not None: mask &= df["end_time"] < _utc(end) + pd.Timedelta(days=1)
+    return df[mask]
+
+def outcome_summary(df, by):
+    """Games, win/draw/loss rates (in percent) and mean accuracy per group."""
+    indicators = df.assign(**{outcome: (df["outcome"] == outcome) * 100.0 for outcome in ("win", "draw", "loss")})
+    return indicators.groupby(by, observed=True).agg(
+        games=("url", "size"), win_rate=("win", "mean"), draw_rate=("draw", "mean"),
+        loss_rate=("loss", "mean"), avg_accuracy=("accuracy", "mean"))
+
+def color_summary(df):
+    return outcome_summary(df, "color").reindex(["white", "black"])
+
+def time_class_summary(df):
+    return outcome_summary(df, ["time_class", "color"])
+
+def top_openings(df, n=5):
+    """The `n` most played openings per colour, as {color: [(opening, games), ...]}."""
+    counts = df.groupby(["color", "opening"], observed=True).size().sort_values(ascending=False)
+    top = counts.groupby(level="color", observed=True).head(n)
+    return {color: [(opening, int(games)) for (c, opening), games in top.items() if c == color] for color in ("white", "black")}
+
+def engine_summary(df, engine):
+    """Per-colour engine accuracy, centipawn loss and error rates for the games of `df` found in `engine`.
+
+    Error rates are per game and, for blunders, per hundred moves played.
+    """
+    analysed = df[["url", "color"]].astype({"color": str}).merge(engine, on=["url", "color"])
+    totals = analysed.groupby("color").agg(
+        games=("url", "size"), engine_accuracy=("engine_accuracy", "mean"), avg_cp_loss=("avg_cp_loss", "mean"),
+        moves=("analysed_moves", "sum"), inaccuracies=("inaccuracies", "sum"), mistakes=("mistakes", "sum"), blunders=("blunders", "sum"))
+    for column in ("inaccuracies", "mistakes", "blunders"): totals[f"{column}_per_game"] = totals[column] / totals["games"]
+    totals["blunders_per_100_moves"] = totals["blunders"] / totals["moves"].where(totals["moves"] > 0) * 100
+    return totals.reindex(["white", "black"])
+
+def format_percent(value):
+    return f"{value:.1f}%" if pd.notna(value) else "N/A"
+
+def summarize(df):
+    """The headline stats shown on the Player Stats pages, computed with group-bys over the frame."""
+    by_color = color_summary(df)
+    openings = top_openings(df) if "opening" in df else {"white": [], "black": []}
+    overall = df["opening"].value_counts() if "opening" in df else pd.Series(dtype=int)
+    return {
+        "games": len(df),
+        "winrate_white": format_percent(by_color.loc["white", "win_rate"]),
+        "winrate_black": format_percent(by_color.loc["black", "win_rate"]),
+        "avg_accuracy_white": format_percent(by_color.loc["white", "avg_accuracy"]),
+        "avg_accuracy_black": format_percent(by_color.loc["black", "avg_accuracy"]),
+        "overall_top_opening": overall.index[0] if len(overall) else "N/A",
+        "white_top_opening": openings["white"][0][0] if openings["white"] else "N/A",
+        "black_top_opening": openings["black"][0][0] if openings["black"] else "N/A",
+        "top_openings_white": openings["white"],
+        "top_openings_black": openings["black"],
+    }
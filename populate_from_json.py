@@ -1,8 +1,8 @@
 import json
-import sqlite3
+from db import connect
 
 def populate_db():
-    conn = sqlite3.connect('chess_ratings.db')
+    conn = connect('chess_ratings.db')
     c = conn.cursor()
 
     with open('data.json') as f:
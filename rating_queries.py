@@ -0,0 +1,69 @@
+from datetime import date
+import pandas as pd
+from db import reader
+
+# --- CONFIGURATION ---
+DB_NAME = "chess_ratings.db"
+# SQLite expressions mapping a rollup day to the first day of its bucket.
+BUCKETS = {
+    "day": "d.day",
+    "week": "date(d.day, 'weekday 0', '-6 days')",
+    "month": "date(d.day, 'start of month')",
+}
+# Widest date range (in days) still drawn at each resolution when the bucket is chosen automatically.
+AUTO_BUCKET_LIMITS = [(120, "day"), (730, "week")]
+
+# --- HELPERS ---
+def choose_bucket(start_day, end_day):
+    """Picks the coarsest resolution that still gives a readable number of points for the range."""
+    span = (end_day - start_day).days
+    for limit, bucket in AUTO_BUCKET_LIMITS:
+        if span <= limit: return bucket
+    return "month"
+
+# --- QUERIES ---
+def rating_filters(db_name=DB_NAME):
+    """Returns the players, categories and date bounds available for filtering."""
+    conn = reader(db_name)
+    players = [row[0] for row in conn.execute(
+        "SELECT name FROM players p WHERE EXISTS (SELECT 1 FROM rating_daily d WHERE d.player_id = p.id) ORDER BY name")]
+    categories = [row[0] for row in conn.execute("SELECT DISTINCT category FROM rating_daily ORDER BY category")]
+    min_day, max_day = conn.execute("SELECT MIN(day), MAX(day) FROM rating_daily").fetchone()
+    to_day = lambda day: date.fromisoformat(day) if day is not None else date.today()
+    return {"players": players, "categories": categories, "min_day": to_day(min_day), "max_day": to_day(max_day)}
+
+def rating_series(players, category=None, start_day=None, end_day=None, bucket="day", db_name=DB_NAME):
+    """Returns the closing rating of each player/category per bucket, read from the daily rollup.
+
+    Day buckets are rollup rows as stored; week and month buckets take the last
+    day in each bucket. Columns: Day (first day of the bucket), player_name,
+    category, rating, games_played (summed over the bucket).
+    """
+    if bucket not in BUCKETS: raise ValueError(f"Unknown bucket '{bucket}'. Expected one of {sorted(BUCKETS)}.")
+    if not players: return pd.DataFrame(columns=["Day", "player_name", "category", "rating", "games_played"])
+    conditions, params = [f"p.name IN ({', '.join('?' * len(players))})"], list(players)
+    if category: conditions.append("d.category = ?"); params.append(category)
+    if start_day: conditions.append("d.day >= ?"); params.append(start_day.isoformat())
+    if end_day: conditions.append("d.day <= ?"); params.append(end_day.isoformat())
+    bucket_expr = BUCKETS[bucket]
+    if bucket == "day":
+        query = f'''
+            SELECT d.day AS Day, p.name AS player_name, d.category, d.close_rating AS rating, d.games_played
+            FROM rating_daily d JOIN players p ON p.id = d.player_id
+            WHERE {' AND '.join(conditions)} ORDER BY d.day
+        '''
+    else:
+        query = f'''
+            WITH ranked AS (
+                SELECT {bucket_expr} AS Day, p.name AS player_name, d.category, d.close_rating AS rating,
+                       SUM(d.games_played) OVER bucket AS games_played,
+                       ROW_NUMBER() OVER (bucket ORDER BY d.day DESC) AS rn
+                FROM rating_daily d JOIN players p ON p.id = d.player_id
+                WHERE {' AND '.join(conditions)}
+                WINDOW bucket AS (PARTITION BY d.player_id, d.category, {bucket_expr})
+            )
+            SELECT Day, player_name, category, rating, games_played FROM ranked WHERE rn = 1 ORDER BY Day
+        '''
+    df = pd.read_sql_query(query, reader(db_name), params=params)
+    df["Day"] = pd.to_datetime(df["Day"])
+    return df
@@ -0,0 +1,60 @@
+from datetime import datetime, timezone
+
+# --- ROLLUP MAINTENANCE ---
+# rating_daily holds one row per player, category and UTC day with the day's
+# open/close/min/max rating and the number of games played. It is kept up to
+# date at write time so readers never aggregate raw rating_points.
+
+def day_of(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%d")
+
+def record_snapshot(conn, player_id, category, ts, rating, record_total=None):
+    """Folds one new rating snapshot into the daily rollup.
+
+    `record_total` is the player's lifetime win+loss+draw count for the category;
+    the increase since the previous snapshot is added to the day's games played.
+    """
+    games_played = 0
+    if record_total is not None:
+        previous = conn.execute('''
+            SELECT record_total FROM rating_daily
+            WHERE player_id = ? AND category = ? AND record_total IS NOT NULL
+            ORDER BY day DESC LIMIT 1
+        ''', (player_id, category)).fetchone()
+        if previous: games_played = max(0, record_total - previous[0])
+    conn.execute('''
+        INSERT INTO rating_daily (player_id, category, day, open_rating, close_rating, min_rating, max_rating, open_ts, close_ts, games_played, record_total)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (player_id, category, day) DO UPDATE SET
+            open_rating = CASE WHEN excluded.open_ts < open_ts THEN excluded.open_rating ELSE open_rating END,
+            open_ts = MIN(open_ts, excluded.open_ts),
+            close_rating = CASE WHEN excluded.close_ts >= close_ts THEN excluded.close_rating ELSE close_rating END,
+            close_ts = MAX(close_ts, excluded.close_ts),
+            min_rating = MIN(min_rating, excluded.min_rating),
+            max_rating = MAX(max_rating, excluded.max_rating),
+            games_played = games_played + excluded.games_played,
+            record_total = COALESCE(excluded.record_total, record_total)
+    ''', (player_id, category, day_of(ts), rating, rating, rating, rating, ts, ts, games_played, record_total))
+
+def rebuild_daily(conn, since_ts=0, player_id=None):
+    """Recomputes rating levels for every day touched by rating_points at or after `since_ts`.
+
+    Used after bulk loads. Games played and record totals already in the rollup are kept.
+    """
+    conditions, params = ["ts >= ?"], [since_ts - since_ts % 86400]
+    if player_id is not None: conditions.append("player_id = ?"); params.append(player_id)
+    conn.execute(f'''
+        INSERT INTO rating_daily (player_id, category, day, open_rating, close_rating, min_rating, max_rating, open_ts, close_ts, games_played)
+        SELECT player_id, category, day, MIN(open_rating), MIN(close_rating), MIN(rating), MAX(rating), MIN(ts), MAX(ts), 0
+        FROM (
+            SELECT player_id, category, date(ts, 'unixepoch') AS day, ts, rating,
+                   FIRST_VALUE(rating) OVER (PARTITION BY player_id, category, date(ts, 'unixepoch') ORDER BY ts ASC) AS open_rating,
+                   FIRST_VALUE(rating) OVER (PARTITION BY player_id, category, date(ts, 'unixepoch') ORDER BY ts DESC) AS close_rating
+            FROM rating_points WHERE {' AND '.join(conditions)}
+        )
+        GROUP BY player_id, category, day
+        ON CONFLICT (player_id, category, day) DO UPDATE SET
+            open_rating = excluded.open_rating, close_rating = excluded.close_rating,
+            min_rating = excluded.min_rating, max_rating = excluded.max_rating,
+            open_ts = excluded.open_ts, close_ts = excluded.close_ts
+    ''', params)
@@ -0,0 +1,85 @@
+import sys
+import asyncio
+import time
+import httpx
+from db import connect, transaction
+from game_store import DB_NAME, sync_player
+from rating_rollup import rebuild_daily
+from chesscom import ChessComClient
+
+# --- CONFIGURATION ---
+# Chess.com time classes tracked on the dashboard, mapped to rating categories. Daily games are not tracked.
+CATEGORIES = {"rapid": "C - Rapid", "blitz": "C - Blitz", "bullet": "C - Bullet"}
+# How far back a routine refresh re-derives points. Covers the open month plus a late-synced previous one.
+REFRESH_LOOKBACK_SECONDS = 40 * 86400
+
+CATEGORY_CASE = "CASE time_class " + " ".join(f"WHEN '{tc}' THEN '{cat}'" for tc, cat in CATEGORIES.items()) + " END"
+TIME_CLASSES = ", ".join(f"'{tc}'" for tc in CATEGORIES)
+
+# --- INGESTION ---
+def ingest_games(conn, player_id, username, since=0):
+    """Turns a player's archived rated games into one rating point per finished game.
+
+    Chess.com stores each side's rating after the game, so `end_time` and that
+    rating form an exact history point. Points are bulk-inserted with one
+    INSERT ... SELECT and deduplicated by the (player, category, ts) key; the
+    daily rollup is rebuilt from `since` with exact games-played counts, even
+    when no point is new. Returns the number of new points.
+    """
+    username = username.lower()
+    before = conn.total_changes
+    for color in ("white", "black"):
+        conn.execute(f'''
+            INSERT OR IGNORE INTO rating_points (player_id, category, ts, rating)
+            SELECT ?, {CATEGORY_CASE}, end_time, {color}_rating FROM archive.games
+            WHERE {color}_username = ? AND end_time >= ? AND rated = 1 AND rules = 'chess'
+              AND time_class IN ({TIME_CLASSES}) AND {color}_rating IS NOT NULL
+        ''', (player_id, username, since))
+    added = conn.total_changes - before
+
+    # Always re-derived: a day's games_played must count games whose points were already stored too.
+    rebuild_daily(conn, since, player_id)
+    counts = conn.execute(f'''
+        SELECT {CATEGORY_CASE} AS category, date(end_time, 'unixepoch') AS day, COUNT(*) FROM (
+            SELECT time_class, end_time FROM archive.games WHERE white_username = ? AND end_time >= ? AND rated = 1 AND rules = 'chess'
+            UNION ALL
+            SELECT time_class, end_time FROM archive.games WHERE black_username = ? AND end_time >= ? AND rated = 1 AND rules = 'chess'
+        ) WHERE time_class IN ({TIME_CLASSES})
+        GROUP BY category, day
+    ''', (username, since, username, since)).fetchall()
+    conn.executemany("UPDATE rating_daily SET games_played = ? WHERE player_id = ? AND category = ? AND day = ?",
+                     [(n, player_id, category, day) for category, day, n in counts])
+    return added
+
+def tracked_players(db_name=DB_NAME, names=None):
+    """(player_id, name, chesscom_username) for players with a linked Chess.com account."""
+    conn = connect(db_name)
+    try:
+        rows = conn.execute("SELECT id, name, chesscom_username FROM players WHERE chesscom_username IS NOT NULL AND chesscom_username != ''").fetchall()
+    finally: conn.close()
+    return [row for row in rows if names is None or row[1] in names]
+
+async def refresh_timelines(names=None, since=None, db_name=DB_NAME, client=None):
+    """Syncs the players' game archives concurrently, then derives their per-game rating points.
+
+    With `since=0` this is a full backfill: every monthly archive is downloaded
+    once (closed months are never fetched again) and all games are ingested.
+    Returns {name: points added}.
+    """
+    if client is None:
+        async with httpx.AsyncClient() as own_client: return await refresh_timelines(names, since, db_name, ChessComClient(own_client))
+    if since is None: since = int(time.time()) - REFRESH_LOOKBACK_SECONDS
+    players = tracked_players(db_name, names)
+    synced = await asyncio.gather(*[sync_player(username, client, db_name) for _, _, username in players], return_exceptions=True)
+    added = {}
+    for (player_id, name, username), result in zip(players, synced):
+        if isinstance(result, Exception):
+            print(f"  ERROR (archives for '{username}'): {result!r}")
+            continue
+        with transaction(db_name) as conn: added[name] = ingest_games(conn, player_id, username, since)
+    return added
+
+if __name__ == "__main__":
+    # Full backfill: python rating_timeline.py [player name ...]
+    results = asyncio.run(refresh_timelines(sys.argv[1:] or None, since=0))
+    for name, count in results.items(): print(f"{name}: {count} rating points added from archived games.")
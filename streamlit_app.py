@@ -3,20 +3,26 @@ import gspread
 from google.oauth2.service_account import Credentials
 import pandas as pd
 import altair as alt
-import requests
 from datetime import datetime, date
-from collections import Counter
 import io
 import chess
 import chess.pgn
-import chess.svg
-from datasets import load_dataset
 import asyncio
 import httpx
 import time
 import json
 import traceback
-from stockfish import Stockfish
+from engine_pool import EnginePool
+from eval_cache import EvalCache, EVAL_CACHE_DB
+from async_bridge import AsyncBridge
+from chesscom import ChessComClient
+from game_analysis import game_positions, position_results, opening_plies, ANALYSIS_PROFILES, DEFAULT_PROFILE, ANALYSIS_DEPTH
+from packed_analysis import PackedAnalysis
+from board_render import analysis_svg
+from openings import OpeningBook
+from build_openings import build_opening_table
+from game_store import sync_player
+from player_stats import games_frame, add_openings, select_games, summarize, recent_months_start
 
 # --- PAGE CONFIG ---
 st.set_page_config(layout="wide", page_title="Chess Dashboard")
@@ -66,24 +72,21 @@ def create_eval_bar(evaluation):
 
 # --- Load Lichess ECO dataset ---
 @st.cache_resource
-def load_opening_maps():
-    try:
-        ds = load_dataset("Lichess/chess-openings", split="train")
-        eco_map = {row["eco"]: row["name"] for row in ds}
-        pgn_map = {row["pgn"]: row["name"] for row in ds}
-        return eco_map, pgn_map
-    except Exception as e:
-        st.error(f"Could not load opening dataset: {e}")
-        return {}, {}
+def load_opening_book():
+    book = OpeningBook()
+    if not book.available:
+        try:
+            build_opening_table(book.path)
+        except Exception as e:
+            st.error(f"Could not load opening dataset: {e}")
+    return book
 
-eco_map, pgn_map = load_opening_maps()
+opening_book = load_opening_book()
 
 # --- Chess.com avatar fetch ---
 def get_chesscom_avatar(username):
     try:
-        r = requests.get(f"https://api.chess.com/pub/player/{username}", headers=HEADERS)
-        r.raise_for_status()
-        return r.json().get("avatar", None)
+        return get_async_bridge().run(get_chesscom_client().get_json(f"https://api.chess.com/pub/player/{username}")).get("avatar", None)
     except Exception as e:
         st.warning(f"Could not fetch avatar for {username}: {e}")
         return None
@@ -110,66 +113,48 @@ def fetch_current_and_history():
         return [], []
 
 # --- ASYNCHRONOUS Chess.com API Helpers ---
+@st.cache_resource
+def get_async_bridge():
+    """One background event loop and persistent HTTP client shared by every session and rerun."""
+    return AsyncBridge()
+
+@st.cache_resource
+def get_chesscom_client():
+    """The process-wide Chess.com client: coalesces duplicate requests from concurrent sessions and stays under the rate limit."""
+    return ChessComClient(get_async_bridge().client, HEADERS)
+
+# These run on the AsyncBridge loop thread, which has no Streamlit script context, so they
+# return their problems as messages for the caller to show instead of calling st.warning.
 async def fetch_url_async(client, url):
+    """Returns (json, None), or ({}, error message) if the request failed."""
     try:
         response = await client.get(url, headers=HEADERS)
         response.raise_for_status()
-        return response.json()
+        return response.json(), None
     except httpx.HTTPStatusError as e:
-        st.warning(f"Could not fetch data from {url}. Status code: {e.response.status_code}")
-        return {}
+        return {}, f"Could not fetch data from {url}. Status code: {e.response.status_code}"
     except Exception as e:
-        st.warning(f"Error fetching {url}: {e}")
-        return {}
+        return {}, f"Error fetching {url}: {e}"
 
-async def fetch_player_stats_async(username):
+async def fetch_player_stats_async(username, client):
+    """Returns (stats, warnings)."""
     try:
-        async with httpx.AsyncClient() as client:
-            stats_task = fetch_url_async(client, f"https://api.chess.com/pub/player/{username}/stats")
-            archives_list_task = fetch_url_async(client, f"https://api.chess.com/pub/player/{username}/games/archives")
-            stats_data, archives_list_data = await asyncio.gather(stats_task, archives_list_task)
-            archive_urls = archives_list_data.get("archives", [])[-4:]
-            game_tasks = [fetch_url_async(client, url) for url in archive_urls]
-            monthly_games_responses = await asyncio.gather(*game_tasks)
-            all_games = []
-            for response in monthly_games_responses:
-                all_games.extend(response.get("games", []))
-            return stats_data, all_games
+        stats_task = fetch_url_async(client, f"https://api.chess.com/pub/player/{username}/stats")
+        # Closed months are served from the local archive; only the open month is revalidated.
+        (stats_data, error), synced = await asyncio.gather(stats_task, sync_player(username, client), return_exceptions=True)
+        warnings = [error] if error else []
+        if isinstance(synced, Exception):
+            warnings.append(f"Could not sync game archive for {username}, using stored games: {synced}")
+        return stats_data, warnings
     except Exception as e:
-        st.error(f"Error fetching player stats for {username}: {e}")
-        return {}, []
-
-# --- PGN parsing ---
-def get_opening_from_pgn(pgn_text):
-    try:
-        game = chess.pgn.read_game(io.StringIO(pgn_text))
-        if not game:
-            return "N/A"
-        
-        eco = game.headers.get("ECO")
-        if eco and eco in eco_map:
-            return eco_map[eco]
-        
-        board = game.board()
-        moves = []
-        for move in game.mainline_moves():
-            moves.append(board.san(move))
-            board.push(move)
-        
-        move_seq = " ".join(moves[:10])
-        for pgn_prefix, name in pgn_map.items():
-            if move_seq.startswith(pgn_prefix):
-                return name
-        return "N/A"
-    except Exception as e:
-        st.warning(f"Error parsing PGN for opening: {e}")
-        return "N/A"
+        return {}, [f"Error fetching player stats for {username}: {e}"]
 
 # --- Player Stats Calculation ---
 @st.cache_data(ttl=86400, show_spinner="Fetching player statistics...")
 def compute_player_stats(username):
     try:
-        stats, all_games = asyncio.run(fetch_player_stats_async(username))
+        stats, warnings = get_async_bridge().run(fetch_player_stats_async(username, get_chesscom_client()))
+        for warning in warnings: st.warning(warning)
         overall_rates = {}
         for cat in ["rapid", "blitz", "bullet"]:
             rec = stats.get(f"chess_{cat}", {}).get("record", {})
@@ -177,50 +162,10 @@ def compute_player_stats(username):
             total = w + l + d
             overall_rates[cat] = f"{100 * w / total:.1f}%" if total > 0 else "N/A"
         
-        overall_opening_counts = Counter()
-        wins_white, total_white, white_accuracies = 0, 0, []
-        wins_black, total_black, black_accuracies = 0, 0, []
-        white_opening_counts, black_opening_counts = Counter(), Counter()
-        username_lower = username.lower()
-
-        for g in all_games:
-            opening_name = g.get("opening", {}).get("name") or get_opening_from_pgn(g.get("pgn", ""))
-            if opening_name: 
-                overall_opening_counts[opening_name] += 1
-            
-            white_info = g.get("white", {})
-            black_info = g.get("black", {})
-            accuracies = g.get("accuracies")
-            
-            if white_info.get("username", "").lower() == username_lower:
-                total_white += 1
-                if white_info.get("result") == "win": 
-                    wins_white += 1
-                if opening_name: 
-                    white_opening_counts[opening_name] += 1
-                if accuracies and accuracies.get("white"): 
-                    white_accuracies.append(accuracies.get("white"))
-            elif black_info.get("username", "").lower() == username_lower:
-                total_black += 1
-                if black_info.get("result") == "win": 
-                    wins_black += 1
-                if opening_name: 
-                    black_opening_counts[opening_name] += 1
-                if accuracies and accuracies.get("black"): 
-                    black_accuracies.append(accuracies.get("black"))
-                
-        return {
-            "overall_rates": overall_rates,
-            "winrate_white": f"{100 * wins_white / total_white:.1f}%" if total_white > 0 else "N/A",
-            "winrate_black": f"{100 * wins_black / total_black:.1f}%" if total_black > 0 else "N/A",
-            "avg_accuracy_white": f"{sum(white_accuracies) / len(white_accuracies):.1f}%" if white_accuracies else "N/A",
-            "avg_accuracy_black": f"{sum(black_accuracies) / len(black_accuracies):.1f}%" if black_accuracies else "N/A",
-            "overall_top_opening": overall_opening_counts.most_common(1)[0][0] if overall_opening_counts else "N/A",
-            "white_top_opening": white_opening_counts.most_common(1)[0][0] if white_opening_counts else "N/A",
-            "black_top_opening": black_opening_counts.most_common(1)[0][0] if black_opening_counts else "N/A",
-            "top_openings_white": white_opening_counts.most_common(5),
-            "top_openings_black": black_opening_counts.most_common(5),
-        }
+        # Per-colour and opening aggregates over the last 4 archive months, as group-bys on the stored games.
+        games = add_openings(games_frame(username), opening_book)
+        recent = select_games(games, start=recent_months_start(4))
+        return {"overall_rates": overall_rates, **summarize(recent)}
     except Exception as e:
         st.error(f"Error computing player stats: {e}")
         return {
@@ -232,42 +177,42 @@ def compute_player_stats(username):
         }
 
 # --- GAME ANALYSIS FUNCTIONS ---
-def generate_move_comment(move_data):
-    """Generates a human-readable comment for a move."""
-    quality = move_data['move_quality']
-    best_move = move_data['best_move']
-    played_move = move_data['move']
-    eval_loss = move_data['eval_loss']
-
-    if quality == "Excellent":
-        return "Excellent! You found the best move." if played_move == best_move else "An excellent move! Keeps the advantage."
-    elif quality == "Good":
-        return "A good move."
-    elif quality == "Inaccuracy":
-        return f"This is an inaccuracy. The best move was {best_move}, which was slightly better."
-    elif quality == "Mistake":
-        return f"A mistake. You missed the better move, {best_move}. This move loses an advantage of {eval_loss:.2f} pawns."
-    elif quality == "Blunder":
-        return f"A major blunder! This move changes the outcome of the game. The best move was {best_move}."
-    return ""
+@st.cache_resource
+def get_engine_pool(stockfish_path):
+    """
+    Creates one pool of warm Stockfish engines per executable path, shared by every session.
+    """
+    return EnginePool(stockfish_path)
+
+@st.cache_resource
+def get_eval_cache():
+    """Opens the on-disk position evaluation cache shared by every session and kept across restarts."""
+    return EvalCache(EVAL_CACHE_DB)
 
 @st.cache_data(ttl=3600, show_spinner="Analyzing game with local engine...")
-def analyze_game_with_stockfish(pgn_data, stockfish_path="/usr/games/stockfish"): # Changed to a common Linux path
+def analyze_game_with_stockfish(pgn_data, stockfish_path="/usr/games/stockfish", profile=DEFAULT_PROFILE): # Changed to a common Linux path
     """
-    Analyzes a game using a local Stockfish engine.
+    Analyzes a game using a local Stockfish engine, within the node and time budget of an analysis profile.
     """
     try:
-        stockfish = Stockfish(path=stockfish_path)
+        pool = get_engine_pool(stockfish_path)
+        with pool.checkout() as stockfish:
+            return _analyze_game(stockfish, pgn_data, profile, cache=get_eval_cache(), depth=pool.depth)
     except Exception as e:
         st.error(f"Could not initialize Stockfish from path: {stockfish_path}. Error: {e}")
         st.info("Please ensure Stockfish is installed and its path is correct. Common paths include `/usr/games/stockfish` (Linux) or `/usr/local/bin/stockfish` (macOS/Linux). If running on Windows, provide the full path to your `stockfish.exe` (e.g., `C:/Users/YourUser/Downloads/stockfish.exe`).")
-        return None, None, None
+        return None, None
 
+def _analyze_game(stockfish, pgn_data, profile=DEFAULT_PROFILE, cache=None, depth=ANALYSIS_DEPTH):
+    """
+    Runs the per-position analysis on an engine checked out from the pool.
+    Positions found in `cache` (searched at the pool's `depth`) are not searched again.
+    """
     try:
         game = chess.pgn.read_game(io.StringIO(pgn_data))
         if not game:
             st.error("❌ Invalid PGN format.")
-            return None, None, None
+            return None, None
 
         game_info = {
             'white': game.headers.get('White', 'Unknown'),
@@ -279,80 +224,27 @@ def analyze_game_with_stockfish(pgn_data, stockfish_path="/usr/games/stockfish")
             'opening': game.headers.get('Opening', ''),
         }
 
-        board = game.board()
-        analysis_data = []
-        board_states = [board.fen()] # Store FEN for each position, starting with initial board
-        
-        moves = list(game.mainline_moves())
-        total_moves = len(moves)
+        moves, boards = game_positions(game)
+        # Packed per-position results instead of a dict per ply: this is what Streamlit pickles into its cache and session state.
+        analysis = PackedAnalysis(boards[0].fen(), moves)
+        book_plies = opening_plies(game, opening_book.index) if opening_book.available else 0
         progress_bar = st.progress(0)
         status_text = st.empty()
 
-        for i, move in enumerate(moves):
-            try:
-                turn_color = "White" if board.turn == chess.WHITE else "Black"
-                status_text.text(f"Analyzing move {i + 1}/{total_moves} ({turn_color}'s turn)...")
-                progress_bar.progress((i + 1) / total_moves)
-
-                stockfish.set_fen_position(board.fen())
-                
-                # Get evaluation before the move
-                eval_before = stockfish.get_evaluation() 
-                
-                # Get top engine lines
-                top_engine_lines = stockfish.get_top_moves(3) # Get top 3 moves
-                
-                best_move_uci = stockfish.get_best_move()
-                best_move_san = board.san(chess.Move.from_uci(best_move_uci)) if best_move_uci else None
-
-                actual_move_san = board.san(move)
-                board.push(move) # Make the actual move
-                board_states.append(board.fen()) # Store FEN after the move
-
-                stockfish.set_fen_position(board.fen())
-                eval_after = stockfish.get_evaluation() # Evaluation after the move
-
-                eval_loss = 0
-                if eval_before['type'] == 'cp' and eval_after['type'] == 'cp':
-                    # Calculate eval loss from the perspective of the player whose turn it was
-                    if turn_color == "White":
-                        eval_loss = eval_before['value'] - eval_after['value']
-                    else: # Black's turn
-                        eval_loss = eval_after['value'] - eval_before['value']
-                
-                # Determine move quality based on centipawn loss
-                if eval_loss < 20: move_quality = "Excellent"
-                elif eval_loss < 50: move_quality = "Good"
-                elif eval_loss < 100: move_quality = "Inaccuracy"
-                elif eval_loss < 200: move_quality = "Mistake"
-                else: move_quality = "Blunder"
-                
-                move_analysis = {
-                    'ply': i + 1,
-                    'move_number': (i // 2) + 1, # Chess move numbers increment after White's move
-                    'color': turn_color,
-                    'move': actual_move_san,
-                    'best_move': best_move_san,
-                    'eval_before': eval_before.get('value'),
-                    'eval_after': eval_after.get('value'),
-                    'eval_loss': eval_loss / 100.0, # Convert centipawns to pawns
-                    'move_quality': move_quality,
-                    'top_engine_lines': top_engine_lines # Add top engine lines to analysis data
-                }
-                move_analysis['comment'] = generate_move_comment(move_analysis)
-                analysis_data.append(move_analysis)
-
-            except Exception as e:
-                st.warning(f"Analysis for move {i + 1} failed: {e}")
-                continue
+        # Each position is searched once; its result is the "after" of one ply and the "before" of the next.
+        # Book positions are skipped and node budgets follow the profile, so the game fits its time budget.
+        for i, (position_result, _) in enumerate(position_results(stockfish, boards, cache=cache, depth=depth, profile=profile, book_plies=book_plies)):
+            status_text.text(f"Analyzing position {i + 1}/{len(boards)}...")
+            progress_bar.progress((i + 1) / len(boards))
+            analysis.add_position(position_result)
 
         progress_bar.empty()
         status_text.empty()
-        return game_info, analysis_data, board_states
+        return game_info, analysis
 
     except Exception as e:
         st.error(f"🔥 Unexpected error during local analysis:\n```\n{traceback.format_exc()}\n```")
-        return None, None, None
+        return None, None
 
 # --- Streamlit Layout ---
 tab = st.sidebar.radio("Navigate", ["Dashboard", "Player Stats", "Game Analysis"])
@@ -361,9 +253,8 @@ tab = st.sidebar.radio("Navigate", ["Dashboard", "Player Stats", "Game Analysis"
 # Ensure default values are set for all session state variables
 if 'player_choice' not in st.session_state: st.session_state.player_choice = FRIENDS[0][0]
 if 'analysis_results' not in st.session_state: st.session_state.analysis_results = None
-if 'board_states' not in st.session_state: st.session_state.board_states = None
 if 'pgn_text' not in st.session_state: st.session_state.pgn_text = ""
-# current_ply represents the index in board_states. 0 is initial position.
+# current_ply is the position index in the analysed game. 0 is the initial position.
 if 'current_ply' not in st.session_state: st.session_state.current_ply = 0
 
 # --- Dashboard Tab ---
@@ -484,6 +375,10 @@ elif tab == "Game Analysis":
     # Text area for PGN input, pre-populated if exists in session state
     pgn_text_input = st.text_area("Paste PGN Here:", value=st.session_state.pgn_text, height=250, placeholder="[Event \"Live Chess\"]\n[Site \"Chess.com\"]\n...")
 
+    profile = st.selectbox("Analysis profile", list(ANALYSIS_PROFILES), index=list(ANALYSIS_PROFILES).index(DEFAULT_PROFILE), format_func=str.title,
+                           help="Quick, Standard and Deep search each position harder and allow about "
+                                + ", ".join(f"{p['seconds']}s" for p in ANALYSIS_PROFILES.values()) + " of engine time per game.")
+
     col1, col2 = st.columns(2)
     with col1:
         # Analyze Game button
@@ -493,10 +388,9 @@ elif tab == "Game Analysis":
             else:
                 st.session_state.pgn_text = pgn_text_input # Save PGN to session state
                 st.session_state.current_ply = 0 # Reset ply for new analysis
-                game_info, analysis, boards = analyze_game_with_stockfish(pgn_text_input)
-                if game_info and analysis and boards:
+                game_info, analysis = analyze_game_with_stockfish(pgn_text_input, profile=profile)
+                if game_info and analysis:
                     st.session_state.analysis_results = (game_info, analysis)
-                    st.session_state.board_states = boards
                     st.balloons() # Visual feedback for successful analysis
                 else:
                     st.error("Could not analyze game. Make sure Stockfish is installed and configured correctly.")
@@ -505,7 +399,6 @@ elif tab == "Game Analysis":
         if st.button("🗑️ Clear Analysis", use_container_width=True):
             # Reset all analysis-related session state variables
             st.session_state.analysis_results = None
-            st.session_state.board_states = None
             st.session_state.pgn_text = ""
             st.session_state.current_ply = 0
             st.rerun() # Rerun to clear the display immediately
@@ -520,26 +413,9 @@ elif tab == "Game Analysis":
         board_col, comment_col = st.columns([1, 1])
         
         with board_col:
-            # Determine the best move for the current ply to draw an arrow
-            current_board_for_arrow = chess.Board(st.session_state.board_states[st.session_state.current_ply])
-            arrows_to_draw = []
-
-            # Get the top engine move for the current position
-            current_analysis_index = st.session_state.current_ply - 1 if st.session_state.current_ply > 0 else 0
-            if analysis_data and current_analysis_index < len(analysis_data) and 'top_engine_lines' in analysis_data[current_analysis_index] and analysis_data[current_analysis_index]['top_engine_lines']:
-                best_move_uci_for_arrow = analysis_data[current_analysis_index]['top_engine_lines'][0]['Move']
-                if best_move_uci_for_arrow:
-                    try:
-                        best_move_obj = chess.Move.from_uci(best_move_uci_for_arrow)
-                        # Create a temporary board at the *exact* FEN of the current_ply
-                        # to ensure SAN conversion is correct for the arrow.
-                        temp_board_for_san = chess.Board(st.session_state.board_states[st.session_state.current_ply])
-                        arrows_to_draw.append(chess.svg.Arrow(best_move_obj.from_square, best_move_obj.to_square, color="#008000")) # Green arrow
-                    except ValueError:
-                        pass
-
-
-            st.image(chess.svg.board(board=current_board_for_arrow, size=400, arrows=arrows_to_draw), use_container_width=True)
+            # Draw the engine's best move from the previous position (what should have been played) as a green arrow.
+            # Renders are memoized per (FEN, arrow, size), and the neighbouring plies are rendered in the background.
+            st.image(analysis_svg(analysis_data, st.session_state.current_ply, "#008000", arrow_offset=-1), use_container_width=True)
             
             # Display eval bar below the board
             # If current_ply is 0 (initial position), evaluation is typically 0.
@@ -554,7 +430,7 @@ elif tab == "Game Analysis":
                     st.session_state.current_ply -= 1
                     st.rerun() # Rerun to update the board and comments
             if nav_cols[1].button("Next ➡️", use_container_width=True):
-                if st.session_state.current_ply < len(st.session_state.board_states) - 1:
+                if st.session_state.current_ply < analysis_data.total_plies:
                     st.session_state.current_ply += 1
                     st.rerun() # Rerun to update the board and comments
 
@@ -575,7 +451,7 @@ elif tab == "Game Analysis":
                 quality = move_data['move_quality']
                 if quality == "Excellent": 
                     st.success(f"**{quality}!** {move_data['comment']}")
-                elif quality == "Good": 
+                elif quality in ("Good", "Book"): 
                     st.info(f"**{quality}.** {move_data['comment']}")
                 elif quality == "Inaccuracy": 
                     st.warning(f"**{quality}.** {move_data['comment']}")
@@ -591,13 +467,13 @@ elif tab == "Game Analysis":
                 st.markdown("---") # Separator for clarity
                 st.subheader("Engine Lines (Top 3)")
                 # Display top engine lines for the *current* board position (before the played move)
-                # Note: For current_ply > 0, we look at the 'top_engine_lines' of the *previous* move analysis
+                # Note: For current_ply > 0, we look at the 'top_moves' of the *previous* move analysis
                 # because those were the lines calculated *before* the current displayed move was played.
-                if current_ply > 0 and 'top_engine_lines' in analysis_data[current_ply - 1]:
-                    top_lines = analysis_data[current_ply - 1]['top_engine_lines']
+                if current_ply > 0 and 'top_moves' in analysis_data[current_ply - 1]:
+                    top_lines = analysis_data[current_ply - 1]['top_moves']
                     if top_lines:
                         # Create a temporary board for SAN conversion of engine lines
-                        temp_board_for_engine_lines = chess.Board(st.session_state.board_states[current_ply - 1])
+                        temp_board_for_engine_lines = analysis_data.board(current_ply - 1)
                         for line in top_lines:
                             move_uci = line['Move']
                             try:
@@ -618,14 +494,14 @@ elif tab == "Game Analysis":
                 
                 # For the very first position (ply 0), show the top moves from the analysis_data[0] entry's 'eval_before'
                 # which technically doesn't exist. The top moves at ply 0 should be based on the initial board state.
-                # Since analyze_game_with_stockfish already calculates top_engine_lines for each move *before* the move is made,
-                # the first entry's top_engine_lines will correspond to the top moves from the starting position.
-                if analysis_data and 'top_engine_lines' in analysis_data[0]:
+                # Since analyze_game_with_stockfish already calculates top_moves for each move *before* the move is made,
+                # the first entry's top_moves will correspond to the top moves from the starting position.
+                if analysis_data and 'top_moves' in analysis_data[0]:
                     st.markdown("---")
                     st.subheader("Engine Lines (Top 3) from Initial Position")
-                    top_lines_initial = analysis_data[0]['top_engine_lines']
+                    top_lines_initial = analysis_data[0]['top_moves']
                     if top_lines_initial:
-                        temp_board_initial = chess.Board(st.session_state.board_states[0])
+                        temp_board_initial = analysis_data.board(0)
                         for line in top_lines_initial:
                             move_uci = line['Move']
                             try:
@@ -640,7 +516,7 @@ elif tab == "Game Analysis":
 
         st.header("🔍 Full Move List Analysis")
         # Display the full analysis data in a dataframe
-        df_display = pd.DataFrame(analysis_data)
+        df_display = pd.DataFrame(list(analysis_data))
         # Select and reorder columns for better display
         st.dataframe(df_display[['move_number', 'color', 'move', 'best_move', 'eval_after', 'eval_loss', 'move_quality', 'comment']], use_container_width=True)
 
@@ -1,20 +1,34 @@
 import streamlit as st
+import streamlit.components.v1 as components
 import pandas as pd
 import altair as alt
 import requests
-from datetime import date
+from datetime import date, datetime
 import sqlite3
 import chess
 import chess.pgn
-import chess.svg
 import io
-from stockfish import Stockfish
 import traceback
 import asyncio
 import httpx
-from collections import Counter
-from datasets import load_dataset
 import os
+import hashlib
+from engine_pool import EnginePool
+from async_bridge import AsyncBridge
+from chesscom import ChessComClient
+from eval_cache import EvalCache, EVAL_CACHE_DB, search_key
+from game_analysis import position_results, position_results_parallel, evaluate_position, opening_plies, ANALYSIS_WORKERS, ANALYSIS_PROFILES, DEFAULT_PROFILE
+from analysis_jobs import JobRegistry, ArchiveAnalysisJob
+from board_render import board_svg
+from move_navigator import navigator_html, NAVIGATOR_HEIGHT
+from batch_analysis import analyze_archive
+from openings import OpeningBook
+from build_openings import build_opening_table
+from game_store import sync_player
+from player_stats import games_frame, add_openings, select_games, summarize, time_class_summary, recent_months_start, engine_frame, engine_summary, format_percent
+from db import ensure_schema, reader
+from rating_queries import rating_filters, rating_series, choose_bucket
+from leaderboard import load_leaderboard, refresh_leaderboard
 
 # --- PAGE CONFIG AND CONSTANTS ---
 st.set_page_config(layout="wide", page_title="Chess Dashboard")
@@ -24,6 +38,7 @@ FRIENDS = [
     ("Alex", "naatiry"), ("Kevin", "kevor24"),
 ]
 HEADERS = {"User-Agent": "ChessDashboard/Final-v12.0"}
+ANALYSIS_POLL_SECONDS = 1.0
 
 # --- STOCKFISH PATH CONFIGURATION ---
 def get_stockfish_path():
@@ -48,167 +63,140 @@ def get_stockfish_path():
 
 STOCKFISH_PATH = get_stockfish_path()
 
+@st.cache_resource
+def get_engine_pool():
+    """Creates the process-wide pool of warm Stockfish engines shared by every session."""
+    return EnginePool(STOCKFISH_PATH)
+
+@st.cache_resource
+def get_async_bridge():
+    """One background event loop and persistent HTTP client shared by every session and rerun."""
+    return AsyncBridge()
+
+@st.cache_resource
+def get_chesscom_client():
+    """The process-wide Chess.com client: coalesces duplicate requests from concurrent sessions and stays under the rate limit."""
+    return ChessComClient(get_async_bridge().client, HEADERS)
+
+@st.cache_resource
+def get_eval_cache():
+    """Opens the on-disk position evaluation cache shared by every session and kept across restarts."""
+    return EvalCache(EVAL_CACHE_DB)
+
 # --- SESSION STATE INITIALIZATION ---
-if 'analysis_results' not in st.session_state: st.session_state.analysis_results = None
-if 'board_states' not in st.session_state: st.session_state.board_states = None
+if 'analysis_job' not in st.session_state: st.session_state.analysis_job = None
 if 'pgn_text' not in st.session_state: st.session_state.pgn_text = ""
-if 'current_ply' not in st.session_state: st.session_state.current_ply = 0
 if 'board' not in st.session_state:
     st.session_state.board = chess.Board()
 
 # --- DATA LOADING ---
 @st.cache_resource
-def load_opening_maps():
-    """Loads and caches the Lichess opening dataset."""
-    try:
-        ds = load_dataset("Lichess/chess-openings", split="train")
-        eco_map = {row["eco"]: row["name"] for row in ds}
-        pgn_map = {row["pgn"]: row["name"] for row in ds}
-        return eco_map, pgn_map
-    except Exception as e:
-        st.error(f"Fatal: Could not load the chess openings dataset. Opening analysis will be unavailable. Error: {e}")
-        return None, None
-eco_map, pgn_map = load_opening_maps()
+def load_opening_book():
+    """Opens the precompiled opening table; its rows are only read the first time an opening is looked up."""
+    book = OpeningBook()
+    if not book.available:
+        try: build_opening_table(book.path)
+        except Exception as e:
+            st.error(f"Fatal: Opening table not found and could not be built (run `python build_openings.py` while online). Opening analysis will be unavailable. Error: {e}")
+    return book
+opening_book = load_opening_book()
+
+# Brings the ratings database up to the latest schema (and into WAL mode) once per process.
+ensure_schema(DB_NAME)
+
+@st.cache_data(ttl=60)
+def fetch_rating_filters():
+    """Fetches the players, categories and date bounds of the rating history."""
+    return rating_filters(DB_NAME)
+
+@st.cache_data(ttl=60)
+def fetch_rating_series(players, category, start_day, end_day, bucket):
+    """Fetches one point per player/category/bucket, filtered and downsampled in SQL."""
+    return rating_series(players, category, start_day, end_day, bucket, DB_NAME)
 
 @st.cache_data(ttl=60)
 def fetch_from_db(table_name):
     """Fetches data from the specified SQLite table."""
     try:
-        with sqlite3.connect(DB_NAME) as conn: return pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
+        return pd.read_sql_query(f"SELECT * FROM {table_name}", reader(DB_NAME))
     except sqlite3.OperationalError:
         st.error(f"Database error: The table '{table_name}' was not found. Please run `database_setup.py` and `update_tracker_sqlite.py`.")
         return pd.DataFrame()
 
+@st.cache_data(ttl=60)
+def fetch_last_update_run():
+    """Fetches the most recent updater run (cron or daemon), or None if the updater has not run yet."""
+    row = reader(DB_NAME).execute(
+        "SELECT finished_at, mode, players_checked, players_changed, errors FROM updater_runs ORDER BY id DESC LIMIT 1").fetchone()
+    return dict(zip(["finished_at", "mode", "players_checked", "players_changed", "errors"], row)) if row else None
+
+@st.cache_data(ttl=60)
+def fetch_leaderboard():
+    """Fetches the cached leaderboard tables; never touches the network."""
+    return load_leaderboard(DB_NAME)
+
 # --- CORE LOGIC ---
-def get_opening_name(game_data):
-    """Determines the opening name using a multi-step, robust method."""
-    if not eco_map or not pgn_map: return "Unknown (Dataset unavailable)"
-    pgn_text = game_data.get("pgn")
-    if not pgn_text: return "Unknown"
-    try:
-        pgn_headers = chess.pgn.read_headers(io.StringIO(pgn_text))
-        if not pgn_headers: return "Unknown"
-        eco = pgn_headers.get("ECO");
-        if eco and eco in eco_map: return eco_map[eco]
-        opening = pgn_headers.get("Opening");
-        if opening: return opening
-        game = chess.pgn.read_game(io.StringIO(pgn_text))
-        if not game: return "Unknown"
-        board, moves_san, last_known_opening = game.board(), [], "Unknown"
-        for move in game.mainline_moves():
-            moves_san.append(board.san(move)); board.push(move)
-            current_sequence = " ".join(moves_san)
-            if current_sequence in pgn_map: last_known_opening = pgn_map[current_sequence]
-            if len(moves_san) >= 15: break
-        return last_known_opening
-    except Exception: return "Unknown"
-
-@st.cache_data(ttl=3600, show_spinner="Fetching latest player stats from Chess.com...")
+@st.cache_data(ttl=3600, show_spinner="Fetching latest player games from Chess.com...")
 def get_live_player_analysis(username):
-    """Fetches and computes detailed player stats by analyzing recent game archives."""
-    async def fetch_and_compute():
-        async with httpx.AsyncClient() as client:
-            profile_task = client.get(f"https://api.chess.com/pub/player/{username}", headers=HEADERS)
-            archives_task = client.get(f"https://api.chess.com/pub/player/{username}/games/archives", headers=HEADERS)
-            profile_res, archives_res = await asyncio.gather(profile_task, archives_task)
-            if profile_res.is_error or archives_res.is_error: return {"error": "API request failed."}, None
-            avatar_url, archive_urls = profile_res.json().get("avatar"), archives_res.json().get("archives", [])[-4:]
-            if not archive_urls: return {"error": "No game archives found."}, avatar_url
-            game_responses = await asyncio.gather(*[client.get(url, headers=HEADERS) for url in archive_urls])
-            all_games = [game for res in game_responses if not res.is_error for game in res.json().get("games", [])]
-            if not all_games: return {"error": "No games found in recent archives."}, avatar_url
-            stats = {"wins_white":0,"total_white":0,"white_accuracies":[],"wins_black":0,"total_black":0,"black_accuracies":[],"white_openings":Counter(),"black_openings":Counter()}
-            username_lower = username.lower()
-            for g in all_games:
-                if g.get('rules') != 'chess': continue
-                opening_name = get_opening_name(g)
-                white, black, accuracies = g.get("white",{}), g.get("black",{}), g.get("accuracies",{})
-                if white.get("username","").lower() == username_lower:
-                    stats["total_white"]+=1;
-                    if white.get("result")=="win": stats["wins_white"]+=1
-                    if opening_name!="Unknown": stats["white_openings"][opening_name]+=1
-                    if "white" in accuracies: stats["white_accuracies"].append(accuracies["white"])
-                elif black.get("username","").lower() == username_lower:
-                    stats["total_black"]+=1;
-                    if black.get("result")=="win": stats["wins_black"]+=1
-                    if opening_name!="Unknown": stats["black_openings"][opening_name]+=1
-                    if "black" in accuracies: stats["black_accuracies"].append(accuracies["black"])
-            return {"winrate_white":f"{100*stats['wins_white']/stats['total_white']:.1f}%" if stats['total_white']>0 else "N/A", "winrate_black":f"{100*stats['wins_black']/stats['total_black']:.1f}%" if stats['total_black']>0 else "N/A", "avg_accuracy_white":f"{sum(stats['white_accuracies'])/len(stats['white_accuracies']):.1f}%" if stats['white_accuracies'] else "N/A", "avg_accuracy_black":f"{sum(stats['black_accuracies'])/len(stats['black_accuracies']):.1f}%" if stats['black_accuracies'] else "N/A", "top_openings_white":stats["white_openings"].most_common(5), "top_openings_black":stats["black_openings"].most_common(5)}, avatar_url
-    return asyncio.run(fetch_and_compute())
-
-def generate_move_comment(move_data):
-    """Generates a more detailed, human-readable comment for a move's quality."""
-    quality = move_data['move_quality']
-    best_move = move_data['best_move']
-    played_move = move_data['move']
-    eval_loss = move_data['eval_loss']
-
-    if quality == "Excellent":
-        return "Excellent! You found the best move." if played_move == best_move else "An excellent move! Keeps the advantage."
-    elif quality == "Good":
-        return "A good solid move."
-    elif quality == "Inaccuracy":
-        return f"An inaccuracy. The best move was {best_move}, which was slightly better."
-    elif quality == "Mistake":
-        return f"A mistake. You missed the better move, {best_move}. This move loses an advantage of {eval_loss:.2f} pawns."
-    elif quality == "Blunder":
-        return f"A major blunder! This move significantly worsens your position. The best move was {best_move}."
-    return ""
-
-@st.cache_data(ttl=3600, show_spinner="Analyzing game with local engine...")
-def analyze_game_with_stockfish(pgn_data):
-    """Analyzes a game PGN using a local Stockfish engine."""
+    """Syncs a player's game archive and returns it as a columnar frame (openings resolved) plus their avatar URL."""
+    async def fetch_profile_and_sync(client):
+        # Only months that can still change are requested; everything else comes from the local archive.
+        profile_task = client.get(f"https://api.chess.com/pub/player/{username}", headers=HEADERS)
+        return await asyncio.gather(profile_task, sync_player(username, client), return_exceptions=True)
+    profile_res, synced = get_async_bridge().run(fetch_profile_and_sync(get_chesscom_client()))
+    avatar_url = profile_res.json().get("avatar") if isinstance(profile_res, httpx.Response) and not profile_res.is_error else None
+    games = add_openings(games_frame(username, DB_NAME), opening_book)
+    if games.empty and isinstance(synced, Exception): return {"error": "API request failed."}, avatar_url
+    if games.empty: return {"error": "No games found in the player's archives."}, avatar_url
+    return games, avatar_url
+
+@st.cache_resource
+def get_analysis_jobs():
+    """Holds background game analyses so reruns and other sessions reattach to a run already in progress."""
+    return JobRegistry()
+
+def start_game_analysis(pgn_data, parallel=False, profile=DEFAULT_PROFILE):
+    """Starts (or reattaches to) a background analysis of a game PGN that publishes each ply as it completes.
+
+    Book moves are not searched, and node budgets follow the profile's per-game time budget.
+    """
     if not STOCKFISH_PATH:
         st.error("Stockfish engine not found. Please ensure it is installed and the path is configured correctly in the script.")
-        return None, None, None
-    try:
-        stockfish = Stockfish(path=STOCKFISH_PATH, parameters={"Threads": 4, "Hash": 1024})
-    except Exception as e:
-        st.error(f"Could not initialize Stockfish from path '{STOCKFISH_PATH}'. Error: {e}"); return None, None, None
+        return None
     try:
         game = chess.pgn.read_game(io.StringIO(pgn_data))
-        if not game: st.error("Invalid PGN data."); return None, None, None
-        game_info, board, analysis, states = dict(game.headers), game.board(), [], [game.board().fen()]
-        moves = list(game.mainline_moves())
-        progress_bar, status_text = st.progress(0), st.empty()
-        
-        for i, move in enumerate(moves):
-            turn = "White" if board.turn == chess.WHITE else "Black"
-            status_text.text(f"Analyzing move {i + 1}/{len(moves)} ({turn}'s turn)...")
-            
-            move_san = board.san(move)
-            
-            stockfish.set_fen_position(board.fen())
-            eval_before = stockfish.get_evaluation().get('value')
-            top_moves = stockfish.get_top_moves(3) # Get top 3 moves
-            best_move_san = board.san(chess.Move.from_uci(top_moves[0]['Move'])) if top_moves else "N/A"
-            
-            board.push(move)
-            states.append(board.fen())
-            
-            stockfish.set_fen_position(board.fen())
-            eval_after = stockfish.get_evaluation().get('value')
-            
-            eval_loss = 0
-            if isinstance(eval_before, int) and isinstance(eval_after, int):
-                eval_loss = (eval_before - eval_after) if turn=="White" else (eval_after - eval_before)
-                
-            quality = "Excellent" if eval_loss < 20 else "Good" if eval_loss < 50 else "Inaccuracy" if eval_loss < 100 else "Mistake" if eval_loss < 200 else "Blunder"
-            
-            move_data = {
-                'ply': i + 1, 'move_number': (i // 2) + 1, 'color': turn, 
-                'move': move_san, 'best_move': best_move_san, 'eval_before': eval_before,
-                'eval_after': eval_after, 'eval_loss': eval_loss / 100.0,
-                'move_quality': quality, 'top_moves': top_moves
-            }
-            move_data['comment'] = generate_move_comment(move_data)
-            analysis.append(move_data)
-            progress_bar.progress((i + 1) / len(moves))
-            
-        progress_bar.empty(); status_text.empty()
-        return game_info, analysis, states
+        if not game: st.error("Invalid PGN data."); return None
+        pool, cache = get_engine_pool(), get_eval_cache()
+        book_plies = opening_plies(game, opening_book.index) if opening_book.available else 0
+        def results(boards):
+            if parallel:
+                yield from position_results_parallel(STOCKFISH_PATH, boards, cache_path=EVAL_CACHE_DB, profile=profile, book_plies=book_plies)
+            else:
+                with pool.checkout() as stockfish:
+                    yield from position_results(stockfish, boards, cache=cache, depth=pool.depth, profile=profile, book_plies=book_plies)
+        key = (hashlib.sha1(pgn_data.encode()).hexdigest(), parallel, profile)
+        return get_analysis_jobs().get_or_start(key, game, results)
     except Exception as e:
-        st.error(f"🔥 Error during analysis: {e}\n{traceback.format_exc()}"); return None, None, None
+        st.error(f"🔥 Error during analysis: {e}\n{traceback.format_exc()}"); return None
+
+@st.cache_data(ttl=60)
+def fetch_engine_analysis(username):
+    """The stored batch engine analysis of a player's games. The short TTL lets a running batch job's results show up."""
+    return engine_frame(username, DB_NAME)
+
+@st.cache_resource
+def get_archive_jobs():
+    """Batch archive analyses by username, shared by every session so a player's archive is only analysed once at a time."""
+    return {}
+
+def start_archive_analysis(username):
+    """Starts analysing a player's not yet analysed games in the background, unless a run is already in progress."""
+    jobs = get_archive_jobs()
+    job = jobs.get(username)
+    if job is None or job.done:
+        job = jobs[username] = ArchiveAnalysisJob(username).start(
+            lambda on_progress: analyze_archive(username, STOCKFISH_PATH, DB_NAME, cache_path=EVAL_CACHE_DB, on_progress=on_progress))
+    return job
 
 @st.cache_data(show_spinner="Analyzing position...")
 def analyze_position_with_stockfish(fen):
@@ -217,11 +205,10 @@ def analyze_position_with_stockfish(fen):
         st.error("Stockfish engine not found.")
         return None
     try:
-        stockfish = Stockfish(path=STOCKFISH_PATH, parameters={"Threads": 2, "Hash": 512})
-        stockfish.set_fen_position(fen)
-        evaluation = stockfish.get_evaluation()
-        top_moves = stockfish.get_top_moves(3)
-        return {"evaluation": evaluation, "top_moves": top_moves}
+        pool = get_engine_pool()
+        with pool.checkout() as stockfish:
+            result, _ = evaluate_position(stockfish, chess.Board(fen), cache=get_eval_cache(), search=search_key(stockfish, pool.depth))
+        return result
     except Exception as e:
         st.error(f"Error during position analysis: {e}")
         return None
@@ -233,8 +220,34 @@ def create_eval_bar(evaluation):
     eval_in_pawns = evaluation / 100.0
     return f"""<div style="position:relative;background-color:#333;border:1px solid #555;height:25px;width:100%;border-radius:5px;overflow:hidden;"><div style="background-color:white;height:100%;width:{percentage}%;"></div><div style="position:absolute;top:0;left:0;width:100%;height:100%;text-align:center;color:{'black' if 40<percentage<60 else 'white'};line-height:25px;font-size:0.9em;">Eval: {eval_in_pawns:.2f}</div></div>"""
 
+def game_review(job, polling=False):
+    """The review of a background game analysis; run as a fragment that polls the job until every ply is published.
+
+    `polling` is set when the fragment was started with run_every, so it knows to
+    stop (with one full rerun) once the job is done.
+    """
+    # Plies appear here as soon as the background job publishes them; navigation is limited to those.
+    info, analysis = job.game_info, job.analysis.snapshot()
+    if job.error: st.error(f"🔥 Error during analysis: {job.error}")
+    elif not job.done: st.progress(len(analysis) / max(1, job.total_plies), text=f"Analyzing... {len(analysis)}/{job.total_plies} moves ready")
+    
+    st.markdown(f"**White:** {info.get('White', 'N/A')} | **Black:** {info.get('Black', 'N/A')} | **Result:** {info.get('Result', '*')}")
+    st.caption(f"{len(analysis)}/{job.total_plies} plies analysed with {job.engine_calls} engine searches.")
+    # The whole review goes to the browser once; stepping through it (buttons or ←/→/Home/End) never reruns the script.
+    # The HTML only changes with the ply count, so polls that publish nothing new leave the iframe (and its focus) alone.
+    components.html(navigator_html(analysis, key=hashlib.sha1(analysis.moves.tobytes()).hexdigest()), height=NAVIGATOR_HEIGHT)
+    
+    if analysis:
+        with st.expander("Show Full Move List Analysis"):
+            df_display = pd.DataFrame(list(analysis))
+            st.dataframe(df_display[['move_number', 'color', 'move', 'best_move', 'eval_loss', 'move_quality']], use_container_width=True, hide_index=True)
+            st.download_button("📥 Download Analysis (CSV)", df_display.to_csv(index=False), f"analysis_{info.get('White','N_A')}_vs_{info.get('Black','N_A')}.csv", "text/csv")
+
+    # The last ply is in: one full rerun re-creates the fragment without polling.
+    if polling and job.done: st.rerun()
+
 # --- UI LAYOUT ---
-tab = st.sidebar.radio("Navigate", ["Dashboard", "Player Stats", "Game Analysis", "Interactive Analysis"])
+tab = st.sidebar.radio("Navigate", ["Dashboard", "Player Stats", "Leaderboard", "Game Analysis", "Interactive Analysis"])
 
 if tab == "Dashboard":
     st.title("♟️ Chess Rating Dashboard")
@@ -242,123 +255,144 @@ if tab == "Dashboard":
     df_current = fetch_from_db("current_ratings")
     if not df_current.empty: st.dataframe(df_current.set_index('friend_name'), use_container_width=True)
     else: st.warning("No ratings data found. Run `update_tracker_sqlite.py` to populate the database.")
+    last_run = fetch_last_update_run()
+    if last_run:
+        checked_at = datetime.fromtimestamp(last_run["finished_at"]).strftime("%Y-%m-%d %H:%M")
+        st.caption(f"Last update check: {checked_at} ({last_run['mode']}) · {last_run['players_checked']} checked, "
+                   f"{last_run['players_changed']} changed, {last_run['errors']} failed")
     st.subheader("Rating Progression")
-    df_history = fetch_from_db("rating_history")
-    if not df_history.empty:
-        df_history["Date"] = pd.to_datetime(df_history["timestamp"])
-        df_history["Day"] = df_history["Date"].dt.date
-        players = st.sidebar.multiselect("Filter by Player", sorted(df_history["player_name"].unique()), default=sorted(df_history["player_name"].unique()))
-        category = st.sidebar.selectbox("Filter by Category", ["All Categories"] + sorted(df_history["category"].unique()))
-        min_d, max_d = df_history["Day"].min(), df_history["Day"].max()
+    filters = fetch_rating_filters()
+    if filters["players"]:
+        players = st.sidebar.multiselect("Filter by Player", filters["players"], default=filters["players"])
+        category = st.sidebar.selectbox("Filter by Category", ["All Categories"] + filters["categories"])
+        min_d, max_d = filters["min_day"], filters["max_day"]
         dates = st.sidebar.date_input("Select date range", [min_d, max_d])
         start_d, end_d = (dates[0], dates[1]) if len(dates) == 2 else (min_d, max_d)
-        mask = (df_history["Day"].between(start_d, end_d)) & (df_history["player_name"].isin(players)) & (df_history["category"] == category if category != "All Categories" else True)
-        chart = alt.Chart(df_history[mask].groupby(["Day","player_name","category"]).last().reset_index()).mark_line(point=True).encode(
+        resolution = st.sidebar.selectbox("Resolution", ["Auto", "Day", "Week", "Month"])
+        bucket = choose_bucket(start_d, end_d) if resolution == "Auto" else resolution.lower()
+        df_chart = fetch_rating_series(tuple(players), category if category != "All Categories" else None, start_d, end_d, bucket)
+        chart = alt.Chart(df_chart).mark_line(point=True).encode(
             x=alt.X("Day:T", title="Date"), y=alt.Y("rating:Q", title="Rating"),
             color=alt.Color("player_name:N", title="Player"), strokeDash=alt.StrokeDash("category:N", title="Category"),
-            tooltip=["Day:T", "player_name:N", "category:N", "rating:Q"]
+            tooltip=["Day:T", "player_name:N", "category:N", "rating:Q", "games_played:Q"]
         ).interactive()
         st.altair_chart(chart, use_container_width=True)
 
 elif tab == "Player Stats":
     st.title("📊 Player Stats")
-    if not pgn_map: st.warning("Opening dataset could not be loaded. Opening analysis will be unavailable.", icon="⚠️")
+    if not opening_book.available: st.warning("Opening dataset could not be loaded. Opening analysis will be unavailable.", icon="⚠️")
     choice = st.selectbox("Choose a player", [name for name, _ in FRIENDS])
     username = next(user for name, user in FRIENDS if name == choice)
-    stats, avatar = get_live_player_analysis(username)
+    games, avatar = get_live_player_analysis(username)
     c1, c2 = st.columns([1, 5])
     if avatar: c1.image(avatar, width=100)
     c2.header(choice); c2.markdown(f"*{username} on Chess.com*")
-    if "error" in stats: st.error(f"Could not get live analysis: {stats['error']}")
+    if isinstance(games, dict): st.error(f"Could not get live analysis: {games['error']}")
     else:
-        st.subheader("Performance by Color (Last 4 Months)")
+        c1, c2 = st.columns(2)
+        time_classes = c1.multiselect("Time controls", sorted(games["time_class"].dropna().unique()))
+        first_day, last_day = games["end_time"].min().date(), games["end_time"].max().date()
+        dates = c2.date_input("Games played between", [min(max(first_day, recent_months_start(4).date()), last_day), last_day], min_value=first_day, max_value=last_day)
+        start_d, end_d = (dates[0], dates[1]) if len(dates) == 2 else (first_day, last_day)
+        selected = select_games(games, time_classes, start_d, end_d)
+        stats = summarize(selected)
+        st.subheader("Performance by Color")
+        st.caption(f"{stats['games']} games from {start_d} to {end_d}")
         c1, c2 = st.columns(2)
         c1.metric("Win Rate as White", stats['winrate_white']); c1.metric("Avg Accuracy as White", stats['avg_accuracy_white'])
         c2.metric("Win Rate as Black", stats['winrate_black']); c2.metric("Avg Accuracy as Black", stats['avg_accuracy_black'])
-        st.subheader("Favorite Openings (Last 4 Months)")
+        with st.expander("By time control"):
+            st.dataframe(time_class_summary(selected).round(1), use_container_width=True)
+        st.subheader("Engine Analysis")
+        engine = engine_summary(selected, fetch_engine_analysis(username))
+        analysed = int(engine["games"].fillna(0).sum())
+        st.caption(f"{analysed} of {stats['games']} selected games analysed with our own Stockfish run.")
+        if analysed:
+            c1, c2 = st.columns(2)
+            for column, color in ((c1, "white"), (c2, "black")):
+                blunders = engine.loc[color, "blunders_per_game"]
+                column.metric(f"Engine Accuracy as {color.title()}", format_percent(engine.loc[color, "engine_accuracy"]))
+                column.metric(f"Blunders per Game as {color.title()}", f"{blunders:.2f}" if pd.notna(blunders) else "N/A")
+            with st.expander("Error rates"):
+                st.dataframe(engine.rename(columns={
+                    "games": "Games", "engine_accuracy": "Accuracy", "avg_cp_loss": "Avg CP Loss", "inaccuracies_per_game": "Inaccuracies/Game",
+                    "mistakes_per_game": "Mistakes/Game", "blunders_per_game": "Blunders/Game", "blunders_per_100_moves": "Blunders/100 Moves",
+                })[["Games", "Accuracy", "Avg CP Loss", "Inaccuracies/Game", "Mistakes/Game", "Blunders/Game", "Blunders/100 Moves"]].round(2), use_container_width=True)
+        job = get_archive_jobs().get(username)
+        if job and not job.done:
+            st.progress(job.completed / job.total if job.total else 0.0, text=f"Analysing archive in the background: {job.completed}/{job.total or '?'} games")
+        elif STOCKFISH_PATH and st.button("Analyse all stored games in the background"):
+            start_archive_analysis(username); st.rerun()
+        if job and job.error: st.error(f"🔥 Archive analysis failed: {job.error}")
+        st.subheader("Favorite Openings")
         c1, c2 = st.columns(2)
         c1.markdown("**As White**"); c1.dataframe(pd.DataFrame(stats["top_openings_white"], columns=["Opening", "Games"]), hide_index=True, use_container_width=True)
         c2.markdown("**As Black**"); c2.dataframe(pd.DataFrame(stats["top_openings_black"], columns=["Opening", "Games"]), hide_index=True, use_container_width=True)
+    with st.expander("Chess.com API usage (this server)"):
+        st.caption("Requests sent, responses served from the local HTTP cache (hits) or revalidated with a 304, duplicates served from an in-flight request, waits for the rate limiter, 429 responses and retries.")
+        st.json(get_chesscom_client().metrics())
     st.subheader(f"{choice}'s Rating Progression (From Database)")
-    df_player = fetch_from_db("rating_history")
-    if not df_player.empty and not df_player[df_player["player_name"] == choice].empty:
-        df_player = df_player[df_player["player_name"] == choice]
-        df_player["Date"] = pd.to_datetime(df_player["timestamp"])
+    filters = fetch_rating_filters()
+    df_player = fetch_rating_series((choice,), None, filters["min_day"], filters["max_day"], choose_bucket(filters["min_day"], filters["max_day"]))
+    if not df_player.empty:
         chart = alt.Chart(df_player).mark_line(point=True).encode(
-            x=alt.X("Date:T", title="Date"), y=alt.Y("rating:Q", title="Rating"),
-            color=alt.Color("category:N", title="Category"), tooltip=["Date:T", "category:N", "rating:Q"]
+            x=alt.X("Day:T", title="Date"), y=alt.Y("rating:Q", title="Rating"),
+            color=alt.Color("category:N", title="Category"), tooltip=["Day:T", "category:N", "rating:Q", "games_played:Q"]
         ).interactive()
         st.altair_chart(chart, use_container_width=True)
 
+elif tab == "Leaderboard":
+    st.title("🏆 Leaderboard")
+    if st.button("Recompute from stored games"):
+        with st.spinner("Computing leaderboard..."): refresh_leaderboard(FRIENDS, opening_book, DB_NAME, force=True)
+        fetch_leaderboard.clear()
+    tables, computed_at = fetch_leaderboard()
+    if tables is None: st.info("No leaderboard yet. It is computed by the updater once games are archived, or use the button above.")
+    else:
+        st.caption(f"Computed {datetime.fromtimestamp(computed_at).strftime('%Y-%m-%d %H:%M')} from the local game archive.")
+        st.subheader("Players")
+        players = tables["players"].rename(columns={
+            "player": "Player", "games": "Games", "win_rate": "Win %", "draw_rate": "Draw %", "loss_rate": "Loss %",
+            "avg_accuracy": "Avg Accuracy", "win_rate_white": "Win % (White)", "win_rate_black": "Win % (Black)", "last_game": "Last Game"})
+        st.dataframe(players.round(1), hide_index=True, use_container_width=True)
+        head_to_head = tables["head_to_head"]
+        if not head_to_head.empty:
+            st.subheader("Head-to-Head Score (%)")
+            st.caption("Row player's score against the column player: wins plus half of draws.")
+            st.dataframe(head_to_head.pivot(index="player", columns="opponent", values="score").round(1), use_container_width=True)
+            with st.expander("Head-to-head records"):
+                st.dataframe(head_to_head[["player", "opponent", "games", "wins", "draws", "losses"]], hide_index=True, use_container_width=True)
+        st.subheader("Opening Repertoires")
+        openings = tables["openings"]
+        choice = st.selectbox("Player", players["Player"])
+        c1, c2 = st.columns(2)
+        for column, color in ((c1, "white"), (c2, "black")):
+            column.markdown(f"**As {color.title()}**")
+            column.dataframe(openings[(openings["player"] == choice) & (openings["color"] == color)][["opening", "games"]]
+                             .rename(columns={"opening": "Opening", "games": "Games"}), hide_index=True, use_container_width=True)
+
 elif tab == "Game Analysis":
     st.title("🔍 Game Analysis")
     st.markdown("Paste PGN to get a full analysis using a local Stockfish engine.")
     st.session_state.pgn_text = st.text_area("Paste PGN Here:", value=st.session_state.pgn_text, height=250)
     c1, c2 = st.columns(2)
+    profile = c1.selectbox("Analysis profile", list(ANALYSIS_PROFILES), index=list(ANALYSIS_PROFILES).index(DEFAULT_PROFILE), format_func=str.title,
+                           help="Quick, Standard and Deep search each position harder and allow about "
+                                + ", ".join(f"{p['seconds']}s" for p in ANALYSIS_PROFILES.values()) + " of engine time per game.")
+    parallel = c2.checkbox(f"Parallel analysis ({ANALYSIS_WORKERS} engines)", help="Splits the game's positions across one engine per CPU core.")
+    c1, c2 = st.columns(2)
     if c1.button("Analyze Game", type="primary", use_container_width=True):
         if st.session_state.pgn_text.strip():
-            st.session_state.current_ply = 0
-            info, analysis, boards = analyze_game_with_stockfish(st.session_state.pgn_text)
-            if info and analysis and boards: st.session_state.analysis_results, st.session_state.board_states = (info, analysis), boards; st.rerun()
+            job = start_game_analysis(st.session_state.pgn_text, parallel, profile)
+            if job: st.session_state.analysis_job = job; st.rerun()
         else: st.error("Please paste a PGN to analyze.")
     if c2.button("Clear Analysis", use_container_width=True):
-        st.session_state.analysis_results, st.session_state.board_states, st.session_state.pgn_text, st.session_state.current_ply = None, None, "", 0; st.rerun()
+        st.session_state.analysis_job, st.session_state.pgn_text = None, ""; st.rerun()
     
-    if st.session_state.analysis_results:
-        info, analysis = st.session_state.analysis_results
-        
-        board_col, comment_col = st.columns([1, 1.3])
-        
-        with board_col:
-            current_board = chess.Board(st.session_state.board_states[st.session_state.current_ply])
-            
-            arrow = []
-            if st.session_state.current_ply < len(analysis):
-                best_move_uci = analysis[st.session_state.current_ply].get('top_moves', [])[0]['Move']
-                move = chess.Move.from_uci(best_move_uci)
-                arrow.append(chess.svg.Arrow(move.from_square, move.to_square, color="#6B17CC"))
-            
-            st.image(chess.svg.board(board=current_board, arrows=arrow, size=400), use_container_width=True)
-            
-            current_eval = analysis[st.session_state.current_ply - 1]['eval_after'] if st.session_state.current_ply > 0 else 20
-            st.markdown(create_eval_bar(current_eval), unsafe_allow_html=True)
-            nav1, nav2 = st.columns(2)
-            if nav1.button("⬅️ Previous", use_container_width=True, disabled=(st.session_state.current_ply == 0)): st.session_state.current_ply -= 1; st.rerun()
-            if nav2.button("Next ➡️", use_container_width=True, disabled=(st.session_state.current_ply >= len(st.session_state.board_states) - 1)): st.session_state.current_ply += 1; st.rerun()
-            
-        with comment_col:
-            st.markdown(f"**White:** {info.get('White', 'N/A')} | **Black:** {info.get('Black', 'N/A')} | **Result:** {info.get('Result', '*')}")
-            st.divider()
-            
-            if st.session_state.current_ply > 0:
-                move_data = analysis[st.session_state.current_ply - 1]
-                st.subheader(f"Move {move_data['move_number']}: {move_data['color']}")
-                st.markdown(f"#### You played **{move_data['move']}**")
-                quality = move_data['move_quality']
-                if quality == "Excellent": st.success(f"**{quality}!** {move_data['comment']}")
-                elif quality == "Good": st.info(f"**{quality}.** {move_data['comment']}")
-                elif quality == "Inaccuracy": st.warning(f"**{quality}.** {move_data['comment']}")
-                else: st.error(f"**{quality}!** {move_data['comment']}")
-                
-                st.markdown("---")
-                st.subheader("Engine's Top Choices")
-                
-                board_before_move = chess.Board(st.session_state.board_states[st.session_state.current_ply - 1])
-                top_moves = analysis[st.session_state.current_ply - 1].get('top_moves', [])
-                for i, top_move in enumerate(top_moves):
-                    move_uci = top_move['Move']
-                    san = board_before_move.san( chess.Move.from_uci(move_uci))
-                    eval_cp = top_move.get('Centipawn')
-                    eval_str = f"{eval_cp/100.0:.2f}" if eval_cp is not None else "N/A"
-                    st.markdown(f"**{i+1}.** `{san}` (Eval: {eval_str})")
-            else:
-                st.subheader("Starting Position")
-                st.info("Use the navigation buttons to step through the game.")
-        
-        with st.expander("Show Full Move List Analysis"):
-            df_display = pd.DataFrame(analysis)
-            st.dataframe(df_display[['move_number', 'color', 'move', 'best_move', 'eval_loss', 'move_quality']], use_container_width=True, hide_index=True)
-            st.download_button("📥 Download Analysis (CSV)", df_display.to_csv(index=False), f"analysis_{info.get('White','N_A')}_vs_{info.get('Black','N_A')}.csv", "text/csv")
+    job = st.session_state.analysis_job
+    if job:
+        # Only this fragment reruns while the job is publishing plies, never the whole page.
+        st.fragment(game_review, run_every=None if job.done else ANALYSIS_POLL_SECONDS)(job, polling=not job.done)
 
 elif tab == "Interactive Analysis":
     st.title("🔬 Interactive Analysis Board")
@@ -367,9 +401,8 @@ elif tab == "Interactive Analysis":
     board_col, analysis_col = st.columns([1, 1.2])
 
     with board_col:
-        # Display the board using chess.svg.board. The pieces will always be visible.
-        board_svg = chess.svg.board(board=st.session_state.board, size=550)
-        st.image(board_svg, use_container_width=True)
+        # Display the board using chess.svg.board (memoized per position). The pieces will always be visible.
+        st.image(board_svg(st.session_state.board, size=550), use_container_width=True)
 
         # Form for move input
         with st.form(key="move_form", clear_on_submit=True):
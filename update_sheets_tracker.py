@@ -1,6 +1,7 @@
 import gspread
 from google.oauth2.service_account import Credentials
-import requests
+import httpx
+from chesscom import get_json_blocking
 from datetime import datetime
 import pandas as pd
 import smtplib
@@ -71,10 +72,8 @@ def get_api_data(username):
         return None
     url = f"https://api.chess.com/pub/player/{username}/stats"
     try:
-        response = requests.get(url, headers={"User-Agent": "PythonChessTracker/1.0"})
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
+        return get_json_blocking(url, headers={"User-Agent": "PythonChessTracker/1.0"})
+    except httpx.HTTPError as e:
         print(f"  ERROR (Chess.com for '{username}'): {e}")
         return None
 
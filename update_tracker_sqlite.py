@@ -1,5 +1,14 @@
 import sqlite3
-import requests
+import asyncio
+import httpx
+from db import connect, checkpoint
+from rating_rollup import record_snapshot
+from rating_timeline import refresh_timelines
+from leaderboard import refresh_leaderboard
+from openings import OpeningBook
+from async_bridge import AsyncBridge
+from chesscom import ChessComClient
+import time
 from datetime import datetime
 import pandas as pd
 import sys
@@ -14,6 +23,14 @@ FRIENDS = [
     ("Alex", "naatiry", ""),
     ("Kevin", "Kevor24", ""),
 ]
+HEADERS = {"User-Agent": "PythonChessTracker/2.0"}
+MAX_CONCURRENT_REQUESTS = 8
+REQUEST_TIMEOUT_SECONDS = 10.0
+# Daemon polling: (played within N seconds, poll every M seconds). Accounts idle for longer use IDLE_POLL_SECONDS.
+POLL_TIERS = [(3600, 300), (86400, 900), (7 * 86400, 3600)]
+IDLE_POLL_SECONDS = 6 * 3600
+ERROR_RETRY_SECONDS = 300
+MAX_SLEEP_SECONDS = 60
 MANUAL_STARTING_RATINGS = {
     "Simon": {"C - Blitz": 412, "C - Rapid": 1006, "C - Bullet": 716},
     "Ulysse": {"C - Blitz": 1491, "C - Rapid": 1971, "C - Bullet": 1349},
@@ -23,17 +40,31 @@ MANUAL_STARTING_RATINGS = {
 }
 
 # --- HELPER FUNCTIONS ---
-def get_api_data(username):
+async def get_api_data(api, username):
+    """Fetches a player's stats. Rate limiting and retries on timeouts, 429s and 5xx are handled by the ChessComClient.
+
+    Always revalidated with the server: a cached copy up to its max-age old would
+    delay the daemon's change detection by that long. Unchanged stats cost a 304.
+    """
     if not username: return None
-    url = f"https://api.chess.com/pub/player/{username}/stats"
     try:
-        response = requests.get(url, headers={"User-Agent": "PythonChessTracker/2.0"})
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"  ERROR (Chess.com for '{username}'): {e}")
+        return await api.get_json(f"https://api.chess.com/pub/player/{username}/stats", revalidate=True)
+    except httpx.HTTPError as e:
+        print(f"  ERROR (Chess.com for '{username}'): {e!r}")
         return None
 
+def client_options():
+    limits = httpx.Limits(max_connections=MAX_CONCURRENT_REQUESTS, max_keepalive_connections=MAX_CONCURRENT_REQUESTS)
+    return {"headers": HEADERS, "timeout": REQUEST_TIMEOUT_SECONDS, "limits": limits}
+
+async def fetch_all_api_data(usernames, api=None):
+    """Fetches every player's stats concurrently through a ChessComClient (over a fresh connection pool unless `api` is given)."""
+    if api is None:
+        async with httpx.AsyncClient(**client_options()) as client:
+            return await fetch_all_api_data(usernames, ChessComClient(client, HEADERS, max_concurrency=MAX_CONCURRENT_REQUESTS))
+    results = await asyncio.gather(*[get_api_data(api, username) for username in usernames])
+    return dict(zip(usernames, results))
+
 def calculate_diff(new, old):
     if isinstance(new, int) and isinstance(old, int): return new - old
     return None
@@ -57,14 +88,22 @@ def get_stats_from_data(data, category):
         stats["win"], stats["loss"], stats["draw"] = record.get("win", 0), record.get("loss", 0), record.get("draw", 0)
     return stats
 
+def record_total(stats):
+    try: return int(stats.get("win", 0)) + int(stats.get("loss", 0)) + int(stats.get("draw", 0))
+    except (ValueError, TypeError): return None
+
 def get_baseline_rating(conn, player, cat):
     if player in MANUAL_STARTING_RATINGS and cat in MANUAL_STARTING_RATINGS[player]:
         return MANUAL_STARTING_RATINGS[player][cat]
     c = conn.cursor()
-    c.execute("SELECT rating FROM rating_history WHERE player_name = ? AND category = ? ORDER BY timestamp ASC LIMIT 1", (player, cat))
+    c.execute("SELECT r.rating FROM rating_points r JOIN players p ON p.id = r.player_id WHERE p.name = ? AND r.category = ? ORDER BY r.ts ASC LIMIT 1", (player, cat))
     result = c.fetchone()
     return result[0] if result else None
 
+def get_player_id(conn, name, chesscom_user):
+    conn.execute("INSERT INTO players (name, chesscom_username) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET chesscom_username = excluded.chesscom_username", (name, chesscom_user))
+    return conn.execute("SELECT id FROM players WHERE name = ?", (name,)).fetchone()[0]
+
 def get_current_ratings_from_db(conn):
     """Reads the last known ratings from the database."""
     ratings = defaultdict(dict)
@@ -80,15 +119,42 @@ def get_current_ratings_from_db(conn):
         print("Warning: 'current_ratings' table not found or empty. Assuming no prior data.")
     return ratings
 
-def run_update():
-    """Fetches new ratings, compares them to existing ones, and updates the DB only if there are changes."""
+def last_played(data):
+    """Epoch time of the player's most recent rated game across categories, or None."""
+    dates = [(data.get(f"chess_{category}") or {}).get("last", {}).get("date") for category in ("rapid", "blitz", "bullet")] if data else []
+    dates = [safe_int(d) for d in dates if safe_int(d)]
+    return max(dates) if dates else None
+
+def record_run(conn, started_at, mode, stats):
+    conn.execute(
+        "INSERT INTO updater_runs (started_at, finished_at, mode, players_checked, players_changed, errors) VALUES (?, ?, ?, ?, ?, ?)",
+        (started_at, int(time.time()), mode, stats["checked"], len(stats["changed"]), len(stats["failed"])))
+
+def run_update(names=None, mode="once", bridge=None):
+    """Fetches new ratings for `names` (default: every friend), compares them to existing ones, and updates the DB only if there are changes.
+
+    With a `bridge` (the daemon's AsyncBridge) requests reuse its loop and warm
+    connections; otherwise each run gets its own. Either way they go through a
+    rate-limited, coalescing ChessComClient. Returns the run's stats:
+    players checked, changed and failed, plus each player's last game time
+    (used by the daemon's schedule).
+    """
+    if bridge:
+        api = ChessComClient(bridge.client, HEADERS, max_concurrency=MAX_CONCURRENT_REQUESTS)
+        run_async = lambda make: bridge.run(make(api))
+    else:
+        run_async = lambda make: asyncio.run(make(None))
     print(f"\n--- Running update check at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ---")
+    started_at = int(time.time())
+    friends = [friend for friend in FRIENDS if names is None or friend[0] in names]
+    stats = {"checked": len(friends), "changed": [], "failed": [], "last_played": {}}
     
     try:
-        conn = sqlite3.connect(DB_NAME)
+        conn = connect(DB_NAME)
     except sqlite3.Error as e:
         print(f"FATAL: Could not connect to database {DB_NAME}. Error: {e}")
-        sys.exit(1)
+        # Raised rather than sys.exit, so the daemon can treat it like any other failed poll.
+        raise
 
     with conn:
         # Step 1: Read existing ratings from DB
@@ -96,10 +162,15 @@ def run_update():
         
         # Step 2: Fetch new ratings and store them
         new_data = {}
-        has_changed = False
-        for name, chesscom_user, _ in FRIENDS:
-            print(f"Fetching ratings for {name}...")
-            api_data = get_api_data(chesscom_user)
+        print(f"Fetching ratings for {len(friends)} players...")
+        all_api_data = run_async(lambda api: fetch_all_api_data([chesscom_user for _, chesscom_user, _ in friends], api))
+        for name, chesscom_user, _ in friends:
+            api_data = all_api_data.get(chesscom_user)
+            if api_data is None:
+                # A failed fetch must not overwrite the last known ratings with blanks.
+                stats["failed"].append(name)
+                continue
+            stats["last_played"][name] = last_played(api_data)
             
             new_ratings = {
                 'rapid': safe_int(get_stats_from_data(api_data, "rapid")['rating']),
@@ -111,18 +182,21 @@ def run_update():
             # Step 3: Compare new ratings with old ones
             if last_ratings[name] != new_ratings:
                 print(f"  Change detected for {name}.")
-                has_changed = True
+                stats["changed"].append(name)
 
     # Step 4: If no changes were detected, exit gracefully
-    if not has_changed:
-        print("\nNo rating changes detected. Database remains untouched.")
-        return
+    if not stats["changed"]:
+        print("\nNo rating changes detected. Ratings remain untouched.")
+        with conn: record_run(conn, started_at, mode, stats)
+        conn.close()
+        return stats
 
     # Step 5: If there ARE changes, proceed with the full update
     print("\nRating changes detected. Updating database...")
     with conn:
         history_rows_to_append = []
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        timestamp = int(time.time())
+        chesscom_users = {name: chesscom_user for name, chesscom_user, _ in FRIENDS}
 
         for name, data in new_data.items():
             api_data = data['api_data']
@@ -143,15 +217,106 @@ def run_update():
             )
             conn.execute('INSERT OR REPLACE INTO current_ratings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', current_row_data)
 
-            if rapid_rating is not None: history_rows_to_append.append((timestamp, name, "C - Rapid", rapid_rating))
-            if blitz_rating is not None: history_rows_to_append.append((timestamp, name, "C - Blitz", blitz_rating))
-            if bullet_rating is not None: history_rows_to_append.append((timestamp, name, "C - Bullet", bullet_rating))
+            player_id = get_player_id(conn, name, chesscom_users[name])
+            if rapid_rating is not None: history_rows_to_append.append((player_id, "C - Rapid", timestamp, rapid_rating, record_total(rapid)))
+            if blitz_rating is not None: history_rows_to_append.append((player_id, "C - Blitz", timestamp, blitz_rating, record_total(blitz)))
+            if bullet_rating is not None: history_rows_to_append.append((player_id, "C - Bullet", timestamp, bullet_rating, record_total(bullet)))
 
         if history_rows_to_append:
-            print("Writing new data to 'rating_history' table...")
-            conn.executemany('INSERT INTO rating_history (timestamp, player_name, category, rating) VALUES (?,?,?,?)', history_rows_to_append)
+            print("Writing new data to 'rating_points' and 'rating_daily' tables...")
+            for player_id, category, ts, rating, total in history_rows_to_append:
+                inserted = conn.execute('INSERT OR IGNORE INTO rating_points (player_id, category, ts, rating) VALUES (?,?,?,?)',
+                                        (player_id, category, ts, rating)).rowcount
+                # Only fold snapshots that were actually new, so a re-run never double counts games.
+                if inserted: record_snapshot(conn, player_id, category, ts, rating, total)
+        record_run(conn, started_at, mode, stats)
+
+    conn.close()
 
+    # Step 6: Sync the changed players' archives into the games sidecar and derive a rating point per game played since the last poll
+    try:
+        added = run_async(lambda api: refresh_timelines(stats["changed"], db_name=DB_NAME, client=api))
+        print(f"Added {sum(added.values())} per-game rating points from archived games.")
+    except Exception as e:
+        print(f"  ERROR (game timeline refresh): {e!r}")
+
+    # Step 7: Recompute the cached leaderboard if the archived games changed
+    try:
+        if refresh_leaderboard([(name, chesscom_user) for name, chesscom_user, _ in FRIENDS], OpeningBook(), DB_NAME):
+            print("Leaderboard recomputed.")
+    except Exception as e:
+        print(f"  ERROR (leaderboard refresh): {e!r}")
     print("\n✅ SQLite database update complete!")
+    return stats
+
+# --- DAEMON MODE ---
+def poll_interval(last_game, now, errors=0):
+    """Seconds until a player should be polled again: often while they are active, rarely once idle, backing off on errors."""
+    if errors: return min(ERROR_RETRY_SECONDS * 2 ** (errors - 1), IDLE_POLL_SECONDS)
+    if last_game:
+        for played_within, interval in POLL_TIERS:
+            if now - last_game <= played_within: return interval
+    return IDLE_POLL_SECONDS
+
+def due_players(conn, now):
+    """Names of friends with no schedule yet or whose next poll time has passed."""
+    next_due = dict(conn.execute("SELECT p.name, s.next_due FROM player_schedule s JOIN players p ON p.id = s.player_id"))
+    return [name for name, _, _ in FRIENDS if next_due.get(name, 0) <= now]
+
+def schedule_players(conn, stats, now):
+    """Stores each checked player's next due time, derived from how recently they played."""
+    chesscom_users = {name: chesscom_user for name, chesscom_user, _ in FRIENDS}
+    for name in list(stats["last_played"]) + stats["failed"]:
+        player_id = get_player_id(conn, name, chesscom_users[name])
+        failed = name in stats["failed"]
+        previous = conn.execute("SELECT consecutive_errors, last_played FROM player_schedule WHERE player_id = ?", (player_id,)).fetchone()
+        errors = (previous[0] + 1 if previous else 1) if failed else 0
+        last_game = previous[1] if failed and previous else stats["last_played"].get(name)
+        interval = poll_interval(last_game, now, errors)
+        conn.execute('''
+            INSERT INTO player_schedule (player_id, next_due, interval_seconds, last_checked, last_played, consecutive_errors)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (player_id) DO UPDATE SET
+                next_due = excluded.next_due, interval_seconds = excluded.interval_seconds, last_checked = excluded.last_checked,
+                last_played = excluded.last_played, consecutive_errors = excluded.consecutive_errors
+        ''', (player_id, now + interval, interval, now, last_game, errors))
+
+def run_daemon():
+    """Stays resident and polls each player when they are due, instead of everyone once an hour."""
+    print(f"Updater daemon started for {len(FRIENDS)} players. Press Ctrl+C to stop.")
+    conn = connect(DB_NAME)
+    # One loop and connection pool for the daemon's lifetime, so polls skip the DNS/TLS cold start.
+    bridge = AsyncBridge(**client_options())
+    try:
+        while True:
+            due = []
+            try:
+                due = due_players(conn, int(time.time()))
+                if due:
+                    stats = run_update(due, mode="daemon", bridge=bridge)
+                    with conn: schedule_players(conn, stats, int(time.time()))
+                next_due = conn.execute("SELECT MIN(next_due) FROM player_schedule").fetchone()[0] or 0
+            except Exception as e:
+                # A failed poll (e.g. the database locked past the busy timeout) must not stop the daemon:
+                # the due players back off as if their fetch had failed, and the loop carries on.
+                print(f"  ERROR (daemon poll): {e!r}")
+                next_due = int(time.time()) + ERROR_RETRY_SECONDS
+                try:
+                    with conn: schedule_players(conn, {"failed": due, "last_played": {}}, int(time.time()))
+                except Exception as e:
+                    print(f"  ERROR (daemon schedule): {e!r}")
+            time.sleep(min(max(1, next_due - int(time.time())), MAX_SLEEP_SECONDS))
+    except KeyboardInterrupt:
+        print("\nUpdater daemon stopped.")
+    finally:
+        bridge.close()
+        conn.close()
+        checkpoint(DB_NAME)
 
 if __name__ == "__main__":
-    run_update()
+    if "--daemon" in sys.argv[1:]:
+        run_daemon()
+    else:
+        run_update()
+        # Fold the WAL back into chess_ratings.db so the file committed by the scheduled workflow is complete.
+        checkpoint(DB_NAME)